@@ -0,0 +1,31 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+from dotenv import load_dotenv
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Environment configuration, read from .env once per process"""
+    database_url: Optional[str]
+    geodb_api_key: Optional[str]
+    tomtom_api_key: Optional[str]
+    groq_api_key: Optional[str]
+    db_pool_size: int
+    db_max_overflow: int
+    groq_concurrency: int
+
+
+@lru_cache
+def get_settings() -> Settings:
+    load_dotenv()
+    return Settings(
+        database_url=os.getenv("DATABASE_URL"),
+        geodb_api_key=os.getenv("GEODB_API_KEY"),
+        tomtom_api_key=os.getenv("TOMTOM_API_KEY"),
+        groq_api_key=os.getenv("GROQ_API_KEY"),
+        db_pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+        db_max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "40")),
+        groq_concurrency=int(os.getenv("GROQ_CONCURRENCY", "20")),
+    )
@@ -1,14 +1,23 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-import os
-from dotenv import load_dotenv
+from config import get_settings
+import orjson
 
-load_dotenv()
+settings = get_settings()
+DATABASE_URL = settings.database_url
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-engine = create_engine(DATABASE_URL)
+# JSON columns are encoded/decoded once by the driver layer with orjson.
+# The default 5 + 10 pool is too small once handlers and background tasks share it;
+# pre-ping replaces connections Postgres dropped while idle instead of failing the request.
+engine = create_engine(
+    DATABASE_URL,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_pre_ping=True,
+    json_serializer=lambda obj: orjson.dumps(obj).decode(),
+    json_deserializer=orjson.loads,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_db():
@@ -1,8 +1,13 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from database import engine
 from models import Base
 from routers import location, restaurant, search, ml_routes
+from services.http_client import close_http_client
+from services.search_enrichment import finish_interrupted_searches
 import logging
 
 # Configure logging to show INFO level messages
@@ -13,7 +18,14 @@ logging.basicConfig(
 
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    finish_interrupted_searches()
+    yield
+    await close_http_client()
+
+# orjson renders every JSON response, including nested search payloads and datetimes
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,6 +36,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Search listings can run to megabytes of JSON, small responses are left uncompressed
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 app.include_router(location.router, prefix="/api", tags=["locations"])
 app.include_router(restaurant.router, prefix="/api", tags=["restaurants"])
 app.include_router(search.router, prefix="/api", tags=["searches"])
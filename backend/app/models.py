@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Boolean, JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
@@ -16,10 +16,10 @@ class RestaurantDetails(Base):
     # Groq-enhanced data
     description = Column(Text, nullable=True)
     review_summary = Column(Text, nullable=True)
-    menu_highlights = Column(Text, nullable=True)  # JSON array as string
+    menu_highlights = Column(JSON, nullable=True)  # List[str]
     price_level = Column(Integer, nullable=True)  # 1-5 scale
     cuisine = Column(String, nullable=True)
-    tags = Column(Text, nullable=True)  # JSON array as string
+    tags = Column(JSON, nullable=True)  # List[str]
     
     # Metadata
     groq_processed = Column(Boolean, default=False)
@@ -35,21 +35,35 @@ class Search(Base):
     location_latitude = Column(Float, nullable=True)
     location_longitude = Column(Float, nullable=True)
     location_population = Column(Integer, nullable=True)
+    # pending -> enriching -> ready, Groq details and city restaurants are added in the background
+    status = Column(String, nullable=False, default="pending")
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     restaurants = relationship("Restaurant", back_populates="search", cascade="all, delete-orphan")
     city_restaurants = relationship("CityRestaurant", back_populates="search", cascade="all, delete-orphan")
 
+    @property
+    def location(self):
+        """Location columns in the shape of schemas.Location, None when no city was chosen"""
+        if not self.location_name:
+            return None
+        return {
+            "name": self.location_name,
+            "latitude": self.location_latitude,
+            "longitude": self.location_longitude,
+            "population": self.location_population
+        }
+
 class Restaurant(Base):
     __tablename__ = "restaurants"
     
     id = Column(Integer, primary_key=True, index=True)
-    search_id = Column(Integer, ForeignKey("searches.id"), nullable=False)
+    search_id = Column(Integer, ForeignKey("searches.id"), nullable=False, index=True)
     name = Column(String, nullable=False)
     address = Column(String, nullable=False)
-    categories = Column(Text, nullable=True) 
-    category_set = Column(Text, nullable=True)  
+    categories = Column(JSON, nullable=True)  # List[str]
+    category_set = Column(JSON, nullable=True)  # List[int]
     position_lat = Column(Float, nullable=True)
     position_lon = Column(Float, nullable=True)
     tomtom_poi_id = Column(String, nullable=True)
@@ -60,15 +74,22 @@ class Restaurant(Base):
     search = relationship("Search", back_populates="restaurants")
     details = relationship("RestaurantDetails")
 
+    @property
+    def position(self):
+        """Position columns in the shape of schemas.Position"""
+        if self.position_lat is None or self.position_lon is None:
+            return None
+        return {"lat": self.position_lat, "lon": self.position_lon}
+
 class CityRestaurant(Base):
     __tablename__ = "city_restaurants"
     
     id = Column(Integer, primary_key=True, index=True)
-    search_id = Column(Integer, ForeignKey("searches.id"), nullable=False)
+    search_id = Column(Integer, ForeignKey("searches.id"), nullable=False, index=True)
     name = Column(String, nullable=False)
     address = Column(String, nullable=False)
-    categories = Column(Text, nullable=True) 
-    category_set = Column(Text, nullable=True) 
+    categories = Column(JSON, nullable=True)  # List[str]
+    category_set = Column(JSON, nullable=True)  # List[int]
     position_lat = Column(Float, nullable=True)
     position_lon = Column(Float, nullable=True)
     tomtom_poi_id = Column(String, nullable=True)  # TomTom POI ID for future reference
@@ -77,4 +98,11 @@ class CityRestaurant(Base):
     
     # Relationships
     search = relationship("Search", back_populates="city_restaurants")
-    details = relationship("RestaurantDetails")
\ No newline at end of file
+    details = relationship("RestaurantDetails")
+
+    @property
+    def position(self):
+        """Position columns in the shape of schemas.Position"""
+        if self.position_lat is None or self.position_lon is None:
+            return None
+        return {"lat": self.position_lat, "lon": self.position_lon}
\ No newline at end of file
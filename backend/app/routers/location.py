@@ -1,109 +1,135 @@
-from fastapi import APIRouter, Query
-from fastapi.responses import JSONResponse
-import requests
-import os
-from dotenv import load_dotenv
-from typing import List, Dict
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import JSONResponse, Response
+import httpx
+from cachetools import TTLCache
+import orjson
+from typing import List, Dict, Tuple, Union
 import time
-from threading import Lock
+import asyncio
 import logging
+import re
 
 from utils.search_utils import parse_location_query, matches_region, get_search_prefix, fuzzy_filter
+from services.http_client import http_client
+from utils.response_utils import make_cache_entry, cached_json_response
+from utils.request_coalescing import coalesce
+from config import get_settings
 
 logger = logging.getLogger(__name__)
 
-load_dotenv()
-
 router = APIRouter()
 
 GEODB_API_HOST = "wft-geo-db.p.rapidapi.com"
-GEODB_API_KEY = os.getenv("GEODB_API_KEY")
+GEODB_API_KEY = get_settings().geodb_api_key
 
-cache = {}
+# Serialized JSON payload and its ETag, returned as-is on a hit. Bounded so
+# random query prefixes can't grow it without limit.
+cache: TTLCache = TTLCache(maxsize=10_000, ttl=3600)
 last_request_time = 0
 MIN_REQUEST_INTERVAL = 1.2
-request_lock = Lock()
+request_lock = asyncio.Lock()
 
+# GeoDB city names containing digits are dropped from results
+HAS_DIGIT = re.compile(r"\d").search
 
-@router.get("/locations")
-async def search_locations(query: str = Query(..., min_length=1)) -> List[Dict]:
+# Upstream lookups currently in progress, keyed like the cache, so concurrent
+# identical queries share a single GeoDB call
+_inflight: Dict[str, asyncio.Future] = {}
 
-    global last_request_time
 
-    if query in cache:
-        return cache[query]
+@router.get("/locations", response_model=List[Dict])
+async def search_locations(request: Request, query: str = Query(..., min_length=1)) -> Response:
+
+    entry = cache.get(query)
+    if entry is None:
+        entry = await coalesce(_inflight, query, lambda: _fetch_locations(query))
+
+        # Upstream failures come back as an error response instead of a cache entry
+        if isinstance(entry, Response):
+            return entry
+
+    return cached_json_response(request, *entry)
+
+
+async def _fetch_locations(query: str) -> Union[Tuple[bytes, str], Response]:
+    """Query GeoDB for cities matching the query and cache successful results"""
+
+    global last_request_time
 
     city_term, region_filter = parse_location_query(query)
     search_prefix = get_search_prefix(city_term)
 
-    with request_lock:
-        current_time = time.time()
-        elapsed = current_time - last_request_time
+    # Space out upstream requests; the lock makes concurrent handlers wait their turn
+    async with request_lock:
+        elapsed = time.time() - last_request_time
 
         if elapsed < MIN_REQUEST_INTERVAL:
-            time.sleep(MIN_REQUEST_INTERVAL - elapsed)
-
-        url = f"https://{GEODB_API_HOST}/v1/geo/cities"
-        headers = {
-            "X-RapidAPI-Key": GEODB_API_KEY,
-            "X-RapidAPI-Host": GEODB_API_HOST,
-        }
-        params = {
-            "namePrefix": search_prefix,
-            "types": "CITY",
-            "minPopulation": 1000,
-            "sort": "-population",
-        }
-
-        try:
-            response = requests.get(url, headers=headers, params=params, timeout=10)
-            last_request_time = time.time()
-
-            if response.status_code == 429:
-                logger.warning(f"Rate limited for query: {query}")
-                return JSONResponse(
-                    status_code=429,
-                    content={"error": "Rate limit exceeded. Please slow down your typing."}
-                )
-
-            if response.status_code != 200:
-                logger.error(f"GeoDB API error: {response.status_code}, {response.text}")
-                return JSONResponse(status_code=500, content={"error": "GeoDB API failure"})
-
-            data = response.json()
-            results = []
-            for city in data.get("data", []):
-                city_name = city.get('city', 'Unknown City')
-                region = city.get('region', city.get('regionCode', ''))
-                country = city.get('countryCode', city.get('country', ''))
-
-                if any(char.isdigit() for char in city_name):
-                    continue
-
-                formatted_city = f"{city_name}, {region}, {country}" if region else f"{city_name}, {country}"
-
-                if not matches_region(formatted_city, region_filter):
-                    continue
-
-                results.append({
-                    "name": formatted_city,
-                    "latitude": city.get("latitude"),
-                    "longitude": city.get("longitude"),
-                    "population": city.get('population', 0),
-                })
-
-            results = fuzzy_filter(
-                city_term,
-                results,
-                key_fn=lambda r: r['name'].split(',')[0].strip(),
-                threshold=0.4,
+            await asyncio.sleep(MIN_REQUEST_INTERVAL - elapsed)
+
+        last_request_time = time.time()
+
+    url = f"https://{GEODB_API_HOST}/v1/geo/cities"
+    headers = {
+        "X-RapidAPI-Key": GEODB_API_KEY,
+        "X-RapidAPI-Host": GEODB_API_HOST,
+    }
+    params = {
+        "namePrefix": search_prefix,
+        "types": "CITY",
+        "minPopulation": 1000,
+        "sort": "-population",
+    }
+
+    try:
+        response = await http_client.get(url, headers=headers, params=params, timeout=10)
+
+        if response.status_code == 429:
+            logger.warning("Rate limited for query: %s", query)
+            return JSONResponse(
+                status_code=429,
+                content={"error": "Rate limit exceeded. Please slow down your typing."}
             )
 
-            cache[query] = results
-            return results
-
-        except requests.exceptions.Timeout:
-            return JSONResponse(status_code=500, content={"error": "API timeout"})
-        except Exception as e:
-            logger.error(f"Unexpected error: {e}")
-            return JSONResponse(status_code=500, content={"error": "Internal server error"})
+        if response.status_code != 200:
+            logger.error("GeoDB API error: %s, %s", response.status_code, response.text)
+            return JSONResponse(status_code=500, content={"error": "GeoDB API failure"})
+
+        data = orjson.loads(response.content)
+        results = []
+        for city in data.get("data", []):
+            get = city.get
+            city_name = get('city', 'Unknown City')
+            region = get('region', get('regionCode', ''))
+            country = get('countryCode', get('country', ''))
+
+            if HAS_DIGIT(city_name):
+                continue
+
+            formatted_city = ", ".join(part for part in (city_name, region, country) if part)
+
+            if not matches_region(formatted_city, region_filter):
+                continue
+
+            results.append({
+                "name": formatted_city,
+                "latitude": get("latitude"),
+                "longitude": get("longitude"),
+                "population": get('population', 0),
+            })
+
+        results = fuzzy_filter(
+            city_term,
+            results,
+            key_fn=lambda r: r['name'].split(',')[0].strip(),
+            threshold=0.4,
+        )
+
+        entry = make_cache_entry(orjson.dumps(results))
+        cache[query] = entry
+        return entry
+
+    except httpx.TimeoutException:
+        return JSONResponse(status_code=500, content={"error": "API timeout"})
+    except Exception as e:
+        logger.error("Unexpected error: %s", e)
+        return JSONResponse(status_code=500, content={"error": "Internal server error"})
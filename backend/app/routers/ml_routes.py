@@ -1,15 +1,37 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func
 from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
-from database import get_db
+from database import get_db, SessionLocal
 from models import Restaurant as RestaurantModel, CityRestaurant as CityRestaurantModel
 from services.ml_recommendations import recommendation_system, RecommendationResult
-from pydantic import BaseModel
+from services.search_enrichment import wait_until_enriched
+from pydantic import BaseModel, TypeAdapter
+from functools import lru_cache
+import asyncio
+import bisect
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Similarity score thresholds (ascending) and the label for scores above each
+SCORE_THRESHOLDS = [0.0, 0.5, 0.7, 0.8]
+SCORE_LABELS = ["Moderate match", "Good match", "Very good match", "Excellent match"]
+
+# Feature-specific explanations with mapping to avoid duplicates
+FEATURE_MAPPINGS = {
+    'cuisine': "cuisine",
+    'description': "atmosphere and style",
+    'tags': "atmosphere and style",
+    'menu': "menu offerings",
+    'price': "price level"
+}
+HIGH_FEATURE_SCORE = 0.8
+
+# How long recommendations wait for a new search's background enrichment
+ENRICHMENT_WAIT_TIMEOUT = 300.0
+
 class RecommendationResponse(BaseModel):
     """Response model for recommendations"""
     restaurant_id: int
@@ -20,25 +42,43 @@ class RecommendationResponse(BaseModel):
     feature_scores: dict
     explanation: str
 
+# Validates a whole recommendation list in one pydantic-core call
+RECOMMENDATION_LIST_ADAPTER = TypeAdapter(List[RecommendationResponse])
+
 class RecommendationRequest(BaseModel):
     """Request model for recommendations"""
     search_id: int
     top_k: Optional[int] = 10
 
+def load_search_restaurants(model, search_id: int) -> list:
+    """Load a search's restaurants with details on a dedicated session, so it can run in a worker thread"""
+    db = SessionLocal()
+    try:
+        return db.query(model).options(
+            joinedload(model.details)
+        ).filter(model.search_id == search_id).all()
+    finally:
+        db.close()
+
+async def load_user_and_city_restaurants(search_id: int):
+    """Run the user and city restaurant queries concurrently instead of back to back"""
+    return await asyncio.gather(
+        asyncio.to_thread(load_search_restaurants, RestaurantModel, search_id),
+        asyncio.to_thread(load_search_restaurants, CityRestaurantModel, search_id),
+    )
+
 @router.post("/recommendations", response_model=List[RecommendationResponse])
-async def get_restaurant_recommendations(
-    request: RecommendationRequest,
-    db: Session = Depends(get_db)
-):
+async def get_restaurant_recommendations(request: RecommendationRequest):
     """Get ML-powered restaurant recommendations based on user preferences"""
     
     try:
-        logger.info(f"Getting recommendations for search_id: {request.search_id}")
+        logger.info("Getting recommendations for search_id: %s", request.search_id)
         
-        # Get user-selected restaurants with details
-        user_restaurants = db.query(RestaurantModel).options(
-            joinedload(RestaurantModel.details)
-        ).filter(RestaurantModel.search_id == request.search_id).all()
+        # A search created moments ago may still be enriching its restaurants
+        await wait_until_enriched(request.search_id, ENRICHMENT_WAIT_TIMEOUT)
+
+        # Get user-selected and city restaurants with details
+        user_restaurants, city_restaurants = await load_user_and_city_restaurants(request.search_id)
         
         if not user_restaurants:
             raise HTTPException(
@@ -46,18 +86,13 @@ async def get_restaurant_recommendations(
                 detail=f"No user restaurants found for search_id {request.search_id}"
             )
         
-        # Get city restaurants with details
-        city_restaurants = db.query(CityRestaurantModel).options(
-            joinedload(CityRestaurantModel.details)
-        ).filter(CityRestaurantModel.search_id == request.search_id).all()
-        
         if not city_restaurants:
             raise HTTPException(
                 status_code=404, 
                 detail=f"No city restaurants found for search_id {request.search_id}"
             )
         
-        logger.info(f"Found {len(user_restaurants)} user restaurants and {len(city_restaurants)} city restaurants")
+        logger.info("Found %s user restaurants and %s city restaurants", len(user_restaurants), len(city_restaurants))
         
         # Generate recommendations using ML system
         recommendations = recommendation_system.get_recommendations(
@@ -71,28 +106,26 @@ async def get_restaurant_recommendations(
             return []
         
         # Convert to response format with explanations
-        response_recommendations = []
-        for i, rec in enumerate(recommendations):
-            # Generate explanation
-            explanation = generate_explanation(rec, i + 1)
-            
-            response_recommendations.append(RecommendationResponse(
-                restaurant_id=rec.restaurant_id,
-                restaurant_name=rec.restaurant_name,
-                address=rec.address,
-                tomtom_poi_id=rec.tomtom_poi_id,
-                similarity_score=round(rec.similarity_score, 3),
-                feature_scores={k: round(v, 3) for k, v in rec.feature_scores.items()},
-                explanation=explanation
-            ))
+        response_recommendations = RECOMMENDATION_LIST_ADAPTER.validate_python([
+            {
+                "restaurant_id": rec.restaurant_id,
+                "restaurant_name": rec.restaurant_name,
+                "address": rec.address,
+                "tomtom_poi_id": rec.tomtom_poi_id,
+                "similarity_score": round(rec.similarity_score, 3),
+                "feature_scores": {k: round(v, 3) for k, v in rec.feature_scores.items()},
+                "explanation": generate_explanation(rec, i + 1),
+            }
+            for i, rec in enumerate(recommendations)
+        ])
         
-        logger.info(f"Returning {len(response_recommendations)} recommendations")
+        logger.info("Returning %s recommendations", len(response_recommendations))
         return response_recommendations
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error generating recommendations: {e}")
+        logger.error("Error generating recommendations: %s", e)
         raise HTTPException(
             status_code=500, 
             detail=f"Failed to generate recommendations: {str(e)}"
@@ -101,34 +134,25 @@ async def get_restaurant_recommendations(
 def generate_explanation(rec: RecommendationResult, rank: int) -> str:
     """Generate human-readable explanation for recommendation"""
     
-    explanations = []
+    # Index of the highest threshold the score exceeds, -1 if none
+    label_index = bisect.bisect_left(SCORE_THRESHOLDS, rec.similarity_score) - 1
     
-    # Similarity score explanation
-    score_thresholds = [
-        (0.8, "Excellent match"),
-        (0.7, "Very good match"),
-        (0.5, "Good match"),
-        (0.0, "Moderate match")
-    ]
+    feature_explanations = frozenset(
+        FEATURE_MAPPINGS[feature]
+        for feature, score in rec.feature_scores.items()
+        if score > HIGH_FEATURE_SCORE and feature in FEATURE_MAPPINGS
+    )
     
-    for threshold, description in score_thresholds:
-        if rec.similarity_score > threshold:
-            explanations.append(description)
-            break
+    return format_explanation(label_index, feature_explanations)
+
+@lru_cache(maxsize=256)
+def format_explanation(label_index: int, feature_explanations: frozenset) -> str:
+    """Join the score label and matched features; only a few dozen combinations exist"""
     
-    # Feature-specific explanations with mapping to avoid duplicates
-    feature_mappings = {
-        'cuisine': "cuisine",
-        'description': "atmosphere and style",
-        'tags': "atmosphere and style",
-        'menu': "menu offerings",
-        'price': "price level"
-    }
+    explanations = []
     
-    feature_explanations = set()
-    for feature, score in rec.feature_scores.items():
-        if score > 0.8 and feature in feature_mappings:
-            feature_explanations.add(feature_mappings[feature])
+    if label_index >= 0:
+        explanations.append(SCORE_LABELS[label_index])
     
     if feature_explanations:
         explanations.append(f"{', '.join(sorted(feature_explanations))}")
@@ -136,21 +160,23 @@ def generate_explanation(rec: RecommendationResult, rank: int) -> str:
     return ": similar ".join(explanations)
 
 @router.get("/recommendations/explain/{search_id}")
-async def explain_recommendations(
+def explain_recommendations(
     search_id: int,
     db: Session = Depends(get_db)
 ):
     """Get detailed explanation of recommendation methodology"""
     
     try:
-        # Get basic stats
-        user_count = db.query(RestaurantModel).filter(
+        # Get basic stats, both counts in a single SELECT
+        user_count_query = db.query(func.count(RestaurantModel.id)).filter(
             RestaurantModel.search_id == search_id
-        ).count()
+        ).scalar_subquery()
         
-        city_count = db.query(CityRestaurantModel).filter(
+        city_count_query = db.query(func.count(CityRestaurantModel.id)).filter(
             CityRestaurantModel.search_id == search_id
-        ).count()
+        ).scalar_subquery()
+        
+        user_count, city_count = db.query(user_count_query, city_count_query).one()
         
         explanation = {
             "methodology": {
@@ -194,26 +220,19 @@ async def explain_recommendations(
         return explanation
         
     except Exception as e:
-        logger.error(f"Error generating explanation: {e}")
+        logger.error("Error generating explanation: %s", e)
         raise HTTPException(status_code=500, detail="Failed to generate explanation")
 
 @router.get("/recommendations/debug/{search_id}")
 async def debug_recommendations(
     search_id: int,
     restaurant_id: Optional[int] = Query(None, description="Specific restaurant to debug"),
-    db: Session = Depends(get_db)
 ):
     """Debug endpoint to see detailed feature processing"""
     
     try:
         # Get restaurants
-        user_restaurants = db.query(RestaurantModel).options(
-            joinedload(RestaurantModel.details)
-        ).filter(RestaurantModel.search_id == search_id).all()
-        
-        city_restaurants = db.query(CityRestaurantModel).options(
-            joinedload(CityRestaurantModel.details)
-        ).filter(CityRestaurantModel.search_id == search_id).all()
+        user_restaurants, city_restaurants = await load_user_and_city_restaurants(search_id)
         
         # Extract features for debugging
         user_features = recommendation_system.extract_features_from_restaurants(user_restaurants, "user")
@@ -273,5 +292,5 @@ async def debug_recommendations(
         return debug_info
         
     except Exception as e:
-        logger.error(f"Error in debug endpoint: {e}")
+        logger.error("Error in debug endpoint: %s", e)
         raise HTTPException(status_code=500, detail=f"Debug failed: {str(e)}")
\ No newline at end of file
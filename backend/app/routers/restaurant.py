@@ -1,108 +1,134 @@
-from fastapi import APIRouter, Query
-from fastapi.responses import JSONResponse
-import os
-import requests
-from dotenv import load_dotenv
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import JSONResponse, Response
+import httpx
+from cachetools import TTLCache
+import orjson
 import time
-from typing import List, Dict, Optional
-from threading import Lock
+from typing import List, Dict, Optional, Tuple, Union
+import asyncio
 import logging
 
 from utils.search_utils import fuzzy_filter
+from services.http_client import http_client
+from utils.response_utils import make_cache_entry, cached_json_response
+from utils.request_coalescing import coalesce
+from config import get_settings
 
 logger = logging.getLogger(__name__)
 
-load_dotenv()
-
 router = APIRouter()
 
-TOMTOM_API_KEY = os.getenv("TOMTOM_API_KEY")
+TOMTOM_API_KEY = get_settings().tomtom_api_key
 TOMTOM_BASE_URL = "https://api.tomtom.com/search/2/search"
 
-cache: Dict[str, List[Dict]] = {}
+# Serialized JSON payload and its ETag, returned as-is on a hit. Bounded so
+# random query prefixes can't grow it without limit.
+cache: TTLCache = TTLCache(maxsize=10_000, ttl=3600)
 last_request_time = 0
 MIN_REQUEST_INTERVAL = 1
-request_lock = Lock()
+request_lock = asyncio.Lock()
+
+# Upstream lookups currently in progress, keyed like the cache, so concurrent
+# identical queries share a single TomTom call
+_inflight: Dict[str, asyncio.Future] = {}
 
-@router.get("/restaurants/search")
+@router.get("/restaurants/search", response_model=List[Dict])
 async def search_restaurants(
+    request: Request,
     query: str = Query(..., min_length=1),
     lat: Optional[float] = Query(None),
     lon: Optional[float] = Query(None),
-) -> List[Dict]:
-
-    global last_request_time
+) -> Response:
 
     cache_key = f"{query}:{lat}:{lon}"
-    if cache_key in cache:
-        return cache[cache_key]
+    entry = cache.get(cache_key)
+    if entry is None:
+        entry = await coalesce(_inflight, cache_key, lambda: _fetch_restaurants(query, lat, lon, cache_key))
+
+        # Upstream failures come back as an error response instead of a cache entry
+        if isinstance(entry, Response):
+            return entry
+
+    return cached_json_response(request, *entry)
+
+async def _fetch_restaurants(
+    query: str,
+    lat: Optional[float],
+    lon: Optional[float],
+    cache_key: str,
+) -> Union[Tuple[bytes, str], Response]:
+    """Query TomTom for restaurants matching the query and cache successful results"""
+
+    global last_request_time
 
-    with request_lock:
-        current_time = time.time()
-        elapsed = current_time - last_request_time
+    # Space out upstream requests; the lock makes concurrent handlers wait their turn
+    async with request_lock:
+        elapsed = time.time() - last_request_time
 
         if elapsed < MIN_REQUEST_INTERVAL:
-            time.sleep(MIN_REQUEST_INTERVAL - elapsed)
-
-        url = f"{TOMTOM_BASE_URL}/{query}.json"
-        params = {
-            "key": TOMTOM_API_KEY,
-            "limit": 30,
-            "language": "en-US",
-            "typeahead": True,
-            "categorySet": "7315",
-            "lat": lat if lat is not None else 39.8283,
-            "lon": lon if lon is not None else -98.5795,
-        }
-
-        try:
-            response = requests.get(url, params=params, timeout=10)
-            last_request_time = time.time()
-
-            if response.status_code == 429:
-                logger.warning("Rate limited for restaurant search")
-                return []
-
-            if response.status_code != 200:
-                logger.error(f"TomTom API error: {response.status_code}")
-                return []
+            await asyncio.sleep(MIN_REQUEST_INTERVAL - elapsed)
+
+        last_request_time = time.time()
+
+    url = f"{TOMTOM_BASE_URL}/{query}.json"
+    params = {
+        "key": TOMTOM_API_KEY,
+        "limit": 30,
+        "language": "en-US",
+        "typeahead": True,
+        "categorySet": "7315",
+        "lat": lat if lat is not None else 39.8283,
+        "lon": lon if lon is not None else -98.5795,
+    }
+
+    try:
+        response = await http_client.get(url, params=params, timeout=10)
+
+        if response.status_code == 429:
+            logger.warning("Rate limited for restaurant search")
+            return JSONResponse(content=[])
+
+        if response.status_code != 200:
+            logger.error("TomTom API error: %s", response.status_code)
+            return JSONResponse(content=[])
             
-            data = response.json()
+        data = orjson.loads(response.content)
             
-            results = []
-            for result in data.get("results", []):
-                poi = result.get("poi", {})
-                address = result.get("address", {})
-                position = result.get("position", {})
+        results = []
+        for result in data.get("results", []):
+            poi = result.get("poi", {})
+            address = result.get("address", {})
+            position = result.get("position", {})
                
-                restaurant = {
-                    "name": poi.get("name", "Unknown Restaurant"),
-                    "categories": poi.get("categories", []),
-                    "categorySet": [cat.get("id") for cat in poi.get("categorySet", [])],
-                    "address": address.get("freeformAddress", "Unknown location"),
-                    "tomtom_poi_id": result.get("id")
-                }
-
-                if position:
-                    restaurant["position"] = {
-                        "lat": position.get("lat"),
-                        "lon": position.get("lon")
-                }
+            restaurant = {
+                "name": poi.get("name", "Unknown Restaurant"),
+                "categories": poi.get("categories", []),
+                "categorySet": [cat.get("id") for cat in poi.get("categorySet", [])],
+                "address": address.get("freeformAddress", "Unknown location"),
+                "tomtom_poi_id": result.get("id")
+            }
+
+            if position:
+                restaurant["position"] = {
+                    "lat": position.get("lat"),
+                    "lon": position.get("lon")
+            }
                 
-                results.append(restaurant)
-
-            results = fuzzy_filter(
-                query,
-                results,
-                key_fn=lambda r: r['name'],
-                threshold=0.3,
-            )
-
-            cache[cache_key] = results
-            return results
-
-        except requests.exceptions.Timeout:
-            return JSONResponse(status_code=500, content={"error": "API timeout"})
-        except Exception as e:
-            logger.error(f"Unexpected error: {e}")
-            return JSONResponse(status_code=500, content={"error": "Internal server error"})
+            results.append(restaurant)
+
+        results = fuzzy_filter(
+            query,
+            results,
+            key_fn=lambda r: r['name'],
+            threshold=0.3,
+        )
+
+        entry = make_cache_entry(orjson.dumps(results))
+        cache[cache_key] = entry
+        return entry
+
+    except httpx.TimeoutException:
+        return JSONResponse(status_code=500, content={"error": "API timeout"})
+    except Exception as e:
+        logger.error("Unexpected error: %s", e)
+        return JSONResponse(status_code=500, content={"error": "Internal server error"})
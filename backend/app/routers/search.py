@@ -1,13 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List, Set
-from database import get_db
+from typing import Dict, List, Optional, Set, Tuple
+from pydantic import TypeAdapter
+from cachetools import TTLCache
+from threading import Lock
+from config import get_settings
+from database import get_db, SessionLocal
 from models import Search, Restaurant as RestaurantModel, CityRestaurant as CityRestaurantModel, RestaurantDetails
-from schemas import SearchCreate, SearchResponse, RestaurantResponse, CityRestaurantResponse, RestaurantDetailsResponse
+from schemas import SearchCreate, SearchResponse, SearchPage
 from services.city_restaurant import search_city_restaurants
-from services.groq_service import get_restaurant_details
-import json
+from services.groq_service import GROQ_BATCH_SIZE, GroqResponse, get_restaurant_details, get_restaurant_details_batch
+from services.search_enrichment import mark_done, mark_pending
+import orjson
 import asyncio
 import logging
 
@@ -15,509 +24,446 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 # Semaphore to control concurrent Groq requests 
-GROQ_SEMAPHORE = asyncio.Semaphore(20) 
+GROQ_SEMAPHORE = asyncio.Semaphore(get_settings().groq_concurrency)
 
-async def process_all_restaurants(
-    user_restaurants_data: List[dict], 
-    city_restaurants_data: List[dict],
-    search_id: int, 
-    db: Session
-):
-    """Simplified restaurant processing with timeout and better error handling"""
-    
-    total_restaurants = len(user_restaurants_data) + len(city_restaurants_data)
-    logger.info(f"Processing {total_restaurants} restaurants with timeouts")
-    
-    # Process restaurants sequentially to avoid deadlocks
-    successful_count = 0
-    failed_count = 0
-    
-    # Process user restaurants
-    for restaurant_data in user_restaurants_data:
-        try:
-            details_id = None
-            
-            # Try to get Groq details with timeout
-            if restaurant_data.get("tomtom_poi_id"):
-                try:
-                    # Add timeout wrapper
-                    details_id = await asyncio.wait_for(
-                        get_or_create_restaurant_details(
-                            restaurant_data["name"],
-                            restaurant_data["address"],
-                            restaurant_data.get("tomtom_poi_id"),
-                            restaurant_data.get("categories", []),
-                            db
-                        ),
-                        timeout=30.0  # 30 second timeout per restaurant
-                    )
-                except asyncio.TimeoutError:
-                    logger.warning(f"Timeout getting details for {restaurant_data['name']}")
-                    details_id = None
-                except Exception as e:
-                    logger.error(f"Error getting details for {restaurant_data['name']}: {e}")
-                    details_id = None
-            
-            # Insert restaurant record
-            db_restaurant = RestaurantModel(
-                search_id=search_id,
-                name=restaurant_data["name"],
-                address=restaurant_data["address"],
-                categories=json.dumps(restaurant_data.get("categories", [])),
-                category_set=json.dumps(restaurant_data.get("categorySet", [])),
-                position_lat=restaurant_data.get("position", {}).get("lat") if restaurant_data.get("position") else None,
-                position_lon=restaurant_data.get("position", {}).get("lon") if restaurant_data.get("position") else None,
-                tomtom_poi_id=restaurant_data.get("tomtom_poi_id"),
-                details_id=details_id
-            )
-            db.add(db_restaurant)
-            db.commit()
-            successful_count += 1
-            logger.info(f"Successfully processed user restaurant: {restaurant_data['name']}")
-            
-        except Exception as e:
-            logger.error(f"Failed to process user restaurant {restaurant_data['name']}: {e}")
-            db.rollback()
-            failed_count += 1
-    
-    # Process city restaurants  
-    for restaurant_data in city_restaurants_data:
-        try:
-            details_id = None
-            
-            # Try to get Groq details with timeout
-            if restaurant_data.get("tomtom_poi_id"):
-                try:
-                    details_id = await asyncio.wait_for(
-                        get_or_create_restaurant_details(
-                            restaurant_data["name"],
-                            restaurant_data["address"],
-                            restaurant_data.get("tomtom_poi_id"),
-                            restaurant_data.get("categories", []),
-                            db
-                        ),
-                        timeout=30.0  # 30 second timeout per restaurant
-                    )
-                except asyncio.TimeoutError:
-                    logger.warning(f"Timeout getting details for {restaurant_data['name']}")
-                    details_id = None
-                except Exception as e:
-                    logger.error(f"Error getting details for {restaurant_data['name']}: {e}")
-                    details_id = None
-            
-            # Insert restaurant record
-            db_restaurant = CityRestaurantModel(
-                search_id=search_id,
-                name=restaurant_data["name"],
-                address=restaurant_data["address"],
-                categories=json.dumps(restaurant_data.get("categories", [])),
-                category_set=json.dumps(restaurant_data.get("categorySet", [])),
-                position_lat=restaurant_data.get("position", {}).get("lat") if restaurant_data.get("position") else None,
-                position_lon=restaurant_data.get("position", {}).get("lon") if restaurant_data.get("position") else None,
-                tomtom_poi_id=restaurant_data.get("tomtom_poi_id"),
-                details_id=details_id
-            )
-            db.add(db_restaurant)
-            db.commit()
-            successful_count += 1
-            logger.info(f"Successfully processed city restaurant: {restaurant_data['name']}")
-            
-        except Exception as e:
-            logger.error(f"Failed to process city restaurant {restaurant_data['name']}: {e}")
-            db.rollback()
-            failed_count += 1
-    
-    logger.info(f"Restaurant processing complete: {successful_count} successful, {failed_count} failed")
-
-async def get_or_create_restaurant_details(
-    name: str, 
-    address: str, 
-    tomtom_poi_id: str,
-    categories: List[str], 
-    db: Session
-) -> int:
-    """Get existing or create new restaurant details using Groq API"""
-    
-    if not tomtom_poi_id:
-        logger.warning(f"No tomtom_poi_id for restaurant: {name}")
-        return None
-    
+# Rows per bulk INSERT, keeps statement size and memory bounded on large city searches
+INSERT_BATCH_SIZE = 1000
+
+# A search doesn't change once its background enrichment is done, so responses can be reused.
+# Pages are keyed on the newest search id, a new search moves every page to a fresh key.
+search_cache: TTLCache = TTLCache(maxsize=1000, ttl=300)
+page_cache: TTLCache = TTLCache(maxsize=200, ttl=300)
+search_cache_lock = Lock()
+
+def invalidate_search_cache(search_id: int):
+    """Drop cached responses that may include the search before its enrichment finished"""
+    with search_cache_lock:
+        search_cache.pop(search_id, None)
+        page_cache.clear()
+
+# Searches fetched per round-trip while streaming the export
+EXPORT_BATCH_SIZE = 100
+
+# Validates a whole page of ORM searches in one pydantic-core call
+SEARCH_LIST_ADAPTER = TypeAdapter(List[SearchResponse])
+
+def build_skeleton_rows(restaurants_data: List[dict], search_id: int, db: Session) -> Tuple[List[dict], Dict[str, dict]]:
+    """Build insert rows linked to any details already stored, plus the restaurants still needing Groq details by POI"""
+    # One lookup per POI so two lookups never race to insert the same details row
+    restaurants_by_poi = {}
+    for restaurant_data in restaurants_data:
+        poi_id = restaurant_data.get("tomtom_poi_id")
+        if poi_id:
+            restaurants_by_poi.setdefault(poi_id, restaurant_data)
+
+    # POIs already enriched by an earlier search come from one IN query instead of a SELECT each
+    details_by_poi = find_existing_details_ids(db, list(restaurants_by_poi))
+    missing = {poi_id: data for poi_id, data in restaurants_by_poi.items() if poi_id not in details_by_poi}
+
+    rows = [
+        build_restaurant_row(restaurant_data, search_id, details_by_poi.get(restaurant_data.get("tomtom_poi_id")))
+        for restaurant_data in restaurants_data
+    ]
+    return rows, missing
+
+async def enrich_restaurant_rows(model, missing: Dict[str, dict], search_id: int, db: Session):
+    """Fetch Groq details for the search's skeleton rows and link the rows to them"""
+    restaurants = list(missing.values())
+    batches = [restaurants[start:start + GROQ_BATCH_SIZE] for start in range(0, len(restaurants), GROQ_BATCH_SIZE)]
+    # Batches run concurrently, GROQ_SEMAPHORE is what throttles the Groq calls
+    batch_ids = await asyncio.gather(*(resolve_details_ids(batch) for batch in batches))
+    details_ids = [details_id for ids in batch_ids for details_id in ids]
+    details_by_poi = {poi_id: details_id for poi_id, details_id in zip(missing, details_ids) if details_id}
+    await run_in_threadpool(attach_details, model, details_by_poi, search_id, db)
+
+def attach_details(model, details_by_poi: Dict[str, int], search_id: int, db: Session):
+    """Set details_id on a search's rows, one executemany UPDATE for all POIs"""
+    if not details_by_poi:
+        return
+
+    table = model.__table__
     try:
-        # Check if details already exist
-        existing_details = db.query(RestaurantDetails).filter(
-            RestaurantDetails.tomtom_poi_id == tomtom_poi_id
-        ).first()
-        
-        if existing_details:
-            logger.info(f"Using existing details for {name}")
-            return existing_details.id
-        
-        async with GROQ_SEMAPHORE:
-            try:
-                groq_response = await get_restaurant_details(name, address, tomtom_poi_id, categories)
-                
-                # Ensure proper data types for JSON storage
-                menu_highlights_json = json.dumps(groq_response.menu_highlights or [])
-                tags_json = json.dumps(groq_response.tags or [])
-                
-                restaurant_details = RestaurantDetails(
-                    tomtom_poi_id=tomtom_poi_id,
-                    description=groq_response.description or "",
-                    review_summary=groq_response.review_summary or "",
-                    menu_highlights=menu_highlights_json,  # Store as JSON string
-                    price_level=groq_response.price_level,  # Integer or None
-                    cuisine=groq_response.cuisine or "",
-                    tags=tags_json,  # Store as JSON string
-                    groq_processed=groq_response.success,
-                    groq_model_used=groq_response.model_used if groq_response.success else None
-                )
-                
-                db.add(restaurant_details)
-                db.commit()
-                db.refresh(restaurant_details)
-                
-                logger.info(f"Created restaurant details for {name} using {'Groq' if groq_response.success else 'fallback'}")
-                return restaurant_details.id
-                
-            except Exception as e:
-                logger.error(f"Failed to create restaurant details for {name}: {e}")
-                db.rollback()
-                
-                # Create fallback empty record
-                try:
-                    restaurant_details = RestaurantDetails(
-                        tomtom_poi_id=tomtom_poi_id,
-                        description="",
-                        review_summary="",
-                        menu_highlights="[]",  # Empty JSON array
-                        price_level=None,
-                        cuisine="",
-                        tags="[]",  # Empty JSON array
-                        groq_processed=False
-                    )
-                    db.add(restaurant_details)
-                    db.commit()
-                    db.refresh(restaurant_details)
-                    return restaurant_details.id
-                except Exception as fallback_error:
-                    logger.error(f"Failed to create fallback details for {name}: {fallback_error}")
-                    db.rollback()
-                    return None
-                
+        db.execute(
+            update(table)
+            .where(table.c.search_id == search_id, table.c.tomtom_poi_id == bindparam("poi_id"))
+            .values(details_id=bindparam("new_details_id")),
+            [{"poi_id": poi_id, "new_details_id": details_id} for poi_id, details_id in details_by_poi.items()],
+        )
+        db.commit()
     except Exception as e:
-        logger.error(f"Database error for restaurant {name}: {e}")
+        logger.error("Failed to link details to %s for search %s: %s", model.__tablename__, search_id, e)
         db.rollback()
-        return None
 
-def convert_restaurant_details_to_response(details: RestaurantDetails) -> RestaurantDetailsResponse:
-    """Convert database RestaurantDetails to response format with proper JSON parsing"""
-    if not details:
-        return None
-    
+def find_existing_details_ids(db: Session, poi_ids: List[str]) -> dict:
+    """Map tomtom_poi_id to RestaurantDetails id for the POIs that already have details"""
+    if not poi_ids:
+        return {}
+    return dict(
+        db.query(RestaurantDetails.tomtom_poi_id, RestaurantDetails.id).filter(
+            RestaurantDetails.tomtom_poi_id.in_(poi_ids)
+        ).all()
+    )
+
+def store_restaurant_rows(model, rows: List[dict], search_id: int, db: Session):
+    """Store a search's user or city restaurant rows in one transaction"""
     try:
-        # Parse JSON strings back to lists, with fallback to empty lists
-        menu_highlights = []
-        if details.menu_highlights:
-            try:
-                menu_highlights = json.loads(details.menu_highlights)
-            except (json.JSONDecodeError, TypeError):
-                menu_highlights = []
-        
-        tags = []
-        if details.tags:
-            try:
-                tags = json.loads(details.tags)
-            except (json.JSONDecodeError, TypeError):
-                tags = []
-        
-        return RestaurantDetailsResponse(
-            id=details.id,
-            tomtom_poi_id=details.tomtom_poi_id,
-            description=details.description or "",
-            review_summary=details.review_summary or "",
-            menu_highlights=menu_highlights,  # List[str]
-            price_level=details.price_level,  # int or None
-            cuisine=details.cuisine or "",
-            tags=tags,  # List[str]
-            groq_processed=details.groq_processed,
-            groq_model_used=details.groq_model_used,
-            created_at=details.created_at,
-            updated_at=details.updated_at
-        )
+        stored = bulk_insert_in_batches(db, model, rows)
+        db.commit()
+        logger.info("Stored %s of %s %s for search %s", stored, len(rows), model.__tablename__, search_id)
     except Exception as e:
-        logger.error(f"Error converting restaurant details: {e}")
-        # Return minimal response on error
-        return RestaurantDetailsResponse(
-            id=details.id,
-            tomtom_poi_id=details.tomtom_poi_id,
-            description="",
-            review_summary="",
-            menu_highlights=[],
-            price_level=None,
-            cuisine="",
-            tags=[],
-            groq_processed=False,
-            groq_model_used=None,
-            created_at=details.created_at,
-            updated_at=details.updated_at
-        )
+        logger.error("Failed to store %s for search %s: %s", model.__tablename__, search_id, e)
+        db.rollback()
 
-def convert_restaurant_to_response(restaurant: RestaurantModel) -> RestaurantResponse:
-    """Convert database Restaurant to response format"""
+def set_search_status(search_id: int, status: str, db: Session):
+    """Record how far the search's background enrichment has got"""
+    db.query(Search).filter(Search.id == search_id).update({Search.status: status})
+    db.commit()
+
+async def enrich_search(search_id: int, search_data: SearchCreate, missing_user_details: Dict[str, dict]):
+    """Background half of create_search: Groq details for the user's restaurants alongside the city restaurants"""
+    # Own session, the request's session is closed once the response has been sent
+    db = SessionLocal()
     try:
-        # Parse JSON fields with fallback
-        categories = []
-        if restaurant.categories:
-            try:
-                categories = json.loads(restaurant.categories)
-            except (json.JSONDecodeError, TypeError):
-                categories = []
-        
-        category_set = []
-        if restaurant.category_set:
-            try:
-                category_set = json.loads(restaurant.category_set)
-            except (json.JSONDecodeError, TypeError):
-                category_set = []
-        
-        # Convert position
-        position = None
-        if restaurant.position_lat is not None and restaurant.position_lon is not None:
-            position = {
-                "lat": restaurant.position_lat,
-                "lon": restaurant.position_lon
-            }
-        
-        # Convert details
-        details = convert_restaurant_details_to_response(restaurant.details) if restaurant.details else None
-        
-        return RestaurantResponse(
-            id=restaurant.id,
-            search_id=restaurant.search_id,
-            name=restaurant.name,
-            address=restaurant.address,
-            categories=categories,  # List[str]
-            categorySet=category_set,  # List[int]
-            position=position,
-            tomtom_poi_id=restaurant.tomtom_poi_id,
-            details=details
+        await run_in_threadpool(set_search_status, search_id, "enriching", db)
+        # The user's Groq lookups overlap the TomTom city search instead of holding it up
+        await asyncio.gather(
+            enrich_user_restaurants(search_id, missing_user_details),
+            enrich_city_restaurants(search_id, search_data),
         )
     except Exception as e:
-        logger.error(f"Error converting restaurant {restaurant.name}: {e}")
-        # Return minimal response on error
-        return RestaurantResponse(
-            id=restaurant.id,
-            search_id=restaurant.search_id,
-            name=restaurant.name,
-            address=restaurant.address,
-            categories=[],
-            categorySet=[],
-            position=None,
-            tomtom_poi_id=restaurant.tomtom_poi_id,
-            details=None
-        )
+        logger.error("Enrichment failed for search %s: %s", search_id, e)
+        db.rollback()
+    finally:
+        # Ready even after a failure, nothing more is coming for this search
+        try:
+            await run_in_threadpool(set_search_status, search_id, "ready", db)
+        except Exception as e:
+            logger.error("Failed to mark search %s ready: %s", search_id, e)
+        db.close()
+        invalidate_search_cache(search_id)
+        mark_done(search_id)
 
-def convert_city_restaurant_to_response(city_restaurant: CityRestaurantModel) -> CityRestaurantResponse:
-    """Convert database CityRestaurant to response format"""
+async def enrich_user_restaurants(search_id: int, missing_user_details: Dict[str, dict]):
+    """Link the search's user restaurants to their Groq details"""
+    # Each half of enrich_search has its own session, their threadpool calls run at the same time
+    db = SessionLocal()
     try:
-        # Parse JSON fields with fallback
-        categories = []
-        if city_restaurant.categories:
-            try:
-                categories = json.loads(city_restaurant.categories)
-            except (json.JSONDecodeError, TypeError):
-                categories = []
-        
-        category_set = []
-        if city_restaurant.category_set:
-            try:
-                category_set = json.loads(city_restaurant.category_set)
-            except (json.JSONDecodeError, TypeError):
-                category_set = []
-        
-        # Convert position
-        position = None
-        if city_restaurant.position_lat is not None and city_restaurant.position_lon is not None:
-            position = {
-                "lat": city_restaurant.position_lat,
-                "lon": city_restaurant.position_lon
-            }
-        
-        # Convert details
-        details = convert_restaurant_details_to_response(city_restaurant.details) if city_restaurant.details else None
-        
-        return CityRestaurantResponse(
-            id=city_restaurant.id,
-            search_id=city_restaurant.search_id,
-            name=city_restaurant.name,
-            address=city_restaurant.address,
-            categories=categories,  # List[str]
-            categorySet=category_set,  # List[int]
-            position=position,
-            tomtom_poi_id=city_restaurant.tomtom_poi_id,
-            details=details
-        )
+        await enrich_restaurant_rows(RestaurantModel, missing_user_details, search_id, db)
     except Exception as e:
-        logger.error(f"Error converting city restaurant {city_restaurant.name}: {e}")
-        # Return minimal response on error
-        return CityRestaurantResponse(
-            id=city_restaurant.id,
-            search_id=city_restaurant.search_id,
-            name=city_restaurant.name,
-            address=city_restaurant.address,
-            categories=[],
-            categorySet=[],
-            position=None,
-            tomtom_poi_id=city_restaurant.tomtom_poi_id,
-            details=None
-        )
+        logger.error("User restaurant enrichment failed for search %s: %s", search_id, e)
+    finally:
+        db.close()
+
+async def enrich_city_restaurants(search_id: int, search_data: SearchCreate):
+    """Find, store and enrich the search's city restaurants"""
+    if not search_data.location:
+        return
+
+    db = SessionLocal()
+    try:
+        city_restaurants_data = await find_city_restaurants(search_data)
+        # City restaurants are listed right away, their details follow as Groq answers
+        city_rows, missing_city_details = await run_in_threadpool(build_skeleton_rows, city_restaurants_data, search_id, db)
+        await run_in_threadpool(store_restaurant_rows, CityRestaurantModel, city_rows, search_id, db)
+        logger.info("=== STARTING CITY RESTAURANT GROQ PROCESSING ===")
+        await enrich_restaurant_rows(CityRestaurantModel, missing_city_details, search_id, db)
+    except Exception as e:
+        logger.error("City restaurant processing failed for search %s: %s", search_id, e)
+    finally:
+        db.close()
+
+def bulk_insert_in_batches(db: Session, model, rows: List[dict]) -> int:
+    """Insert rows in INSERT_BATCH_SIZE chunks and return how many were stored; the caller commits"""
+    stored = 0
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        batch = rows[start:start + INSERT_BATCH_SIZE]
+        # Each chunk gets a savepoint, a bad row only loses its own chunk instead of the whole search
+        try:
+            with db.begin_nested():
+                # Core insert with a list of params goes through the driver's executemany fast path
+                db.execute(insert(model), batch)
+            stored += len(batch)
+        except SQLAlchemyError as e:
+            logger.error("Skipped %s %s rows starting at %s: %s", len(batch), model.__tablename__, start, e)
+    return stored
+
+async def resolve_details_ids(restaurants: List[dict]) -> List[Optional[int]]:
+    """Get the RestaurantDetails ids for a batch of restaurants, None for the whole batch on failure"""
+    # No overall timeout here: waiting on GROQ_SEMAPHORE and the Groq rate limit is queueing, not a
+    # stall, and every Groq call is already bounded by its own timeout once it is actually sent
+    try:
+        return await get_or_create_restaurant_details(restaurants)
+    except Exception as e:
+        logger.error("Error getting details for %s: %s", ", ".join(r["name"] for r in restaurants), e)
+    return [None] * len(restaurants)
+
+def build_restaurant_row(restaurant_data: dict, search_id: int, details_id: Optional[int]) -> dict:
+    """Column mapping for a Restaurant/CityRestaurant bulk insert"""
+    position = restaurant_data.get("position")
+    return {
+        "search_id": search_id,
+        "name": restaurant_data["name"],
+        "address": restaurant_data["address"],
+        "categories": restaurant_data.get("categories", []),
+        "category_set": restaurant_data.get("categorySet", []),
+        "position_lat": position.get("lat") if position else None,
+        "position_lon": position.get("lon") if position else None,
+        "tomtom_poi_id": restaurant_data.get("tomtom_poi_id"),
+        "details_id": details_id,
+    }
+
+async def get_or_create_restaurant_details(restaurants: List[dict]) -> List[Optional[int]]:
+    """Create details for a batch of restaurants using Groq API, reusing rows another search stored first"""
+    async with GROQ_SEMAPHORE:
+        try:
+            groq_responses = await get_restaurant_details_batch(restaurants)
+        except Exception as e:
+            logger.error("Failed to get Groq details for %s restaurants: %s", len(restaurants), e)
+            groq_responses = [None] * len(restaurants)
+
+    # Stored before the fallback pass, a slow or failed fallback can't cost the answers already in hand.
+    # Blocking inserts run in the threadpool, each on its own session since they run concurrently.
+    answered = [index for index, groq_response in enumerate(groq_responses) if groq_response is not None]
+    saved_ids = await asyncio.gather(*(
+        run_in_threadpool(save_restaurant_details, restaurants[index]["name"], restaurants[index]["tomtom_poi_id"], groq_responses[index])
+        for index in answered
+    ))
+    details_ids: List[Optional[int]] = [None] * len(restaurants)
+    for index, details_id in zip(answered, saved_ids):
+        details_ids[index] = details_id
+
+    # Restaurants the batched reply left out are looked up one by one
+    left_out = [index for index, groq_response in enumerate(groq_responses) if groq_response is None]
+    fallback_ids = await asyncio.gather(*(get_or_create_single_details(restaurants[index]) for index in left_out))
+    for index, details_id in zip(left_out, fallback_ids):
+        details_ids[index] = details_id
+    return details_ids
+
+async def get_or_create_single_details(restaurant: dict) -> Optional[int]:
+    """Per-restaurant Groq lookup, None when Groq gave no details so a later search asks again"""
+    async with GROQ_SEMAPHORE:
+        try:
+            groq_response = await get_restaurant_details(
+                restaurant["name"], restaurant["address"], restaurant["tomtom_poi_id"], restaurant.get("categories", [])
+            )
+        except Exception as e:
+            logger.error("Failed to get Groq details for %s: %s", restaurant["name"], e)
+            return None
+
+    # Timed out or failed, the row stays unlinked rather than pointing at empty details
+    if not groq_response.success:
+        return None
+    return await run_in_threadpool(save_restaurant_details, restaurant["name"], restaurant["tomtom_poi_id"], groq_response)
+
+def save_restaurant_details(name: str, tomtom_poi_id: str, groq_response: GroqResponse) -> Optional[int]:
+    """Insert a RestaurantDetails row and return its id, or the existing row's id for the POI"""
+    db = SessionLocal()
+    try:
+        # Insert-or-get in one round trip, the unique index on tomtom_poi_id settles concurrent searches
+        details_id = db.execute(
+            pg_insert(RestaurantDetails).values(
+                tomtom_poi_id=tomtom_poi_id,
+                description=groq_response.description or "",
+                review_summary=groq_response.review_summary or "",
+                menu_highlights=groq_response.menu_highlights or [],
+                price_level=groq_response.price_level,  # Integer or None
+                cuisine=groq_response.cuisine or "",
+                tags=groq_response.tags or [],
+                groq_processed=groq_response.success,
+                groq_model_used=groq_response.model_used if groq_response.success else None
+            ).on_conflict_do_nothing(
+                index_elements=[RestaurantDetails.tomtom_poi_id]
+            ).returning(RestaurantDetails.id)
+        ).scalar()
+        db.commit()
+
+        if details_id is None:
+            # Another search stored the POI first, nothing was inserted or returned
+            logger.info("Using existing details for %s", name)
+            return db.query(RestaurantDetails.id).filter(
+                RestaurantDetails.tomtom_poi_id == tomtom_poi_id
+            ).scalar()
+
+        logger.info("Created restaurant details for %s using %s", name, 'Groq' if groq_response.success else 'fallback')
+        return details_id
+
+    except Exception as e:
+        logger.error("Database error for restaurant %s: %s", name, e)
+        db.rollback()
+        return None
+    finally:
+        db.close()
+
+async def find_city_restaurants(search_data: SearchCreate) -> List[dict]:
+    """Search TomTom for restaurants in the search's city matching the user's categories"""
+    if not search_data.location:
+        return []
+
+    category_ids: Set[int] = {
+        category_id
+        for restaurant_data in search_data.restaurants if restaurant_data
+        for category_id in restaurant_data.categorySet
+    } or {7315}
+    
+    logger.info("Searching city restaurants with categories: %s", category_ids)
+    
+    population = search_data.location.population or 40000
+    
+    city_restaurants_data = await search_city_restaurants(
+        center_lat=search_data.location.latitude,
+        center_lon=search_data.location.longitude,
+        city_name=search_data.location.name,  
+        category_ids=category_ids,
+        population=population,
+    )
+    
+    logger.info("Found %s city restaurants", len(city_restaurants_data))
+    logger.info("=== COMPLETED CITY RESTAURANT SEARCH ===")
+    return city_restaurants_data
+
+def insert_search(search_data: SearchCreate, db: Session) -> int:
+    """Create the search entry and return its id"""
+    location = search_data.location
+    db_search = Search(
+        location_name=location.name if location else None,
+        location_latitude=location.latitude if location else None,
+        location_longitude=location.longitude if location else None,
+        location_population=location.population if location else None,
+    )
+    
+    db.add(db_search)
+    # The INSERT assigns the id on flush; read after commit, the expired row would be SELECTed again
+    db.flush()
+    search_id = db_search.id
+    db.commit()
+    return search_id
 
 @router.post("/searches", response_model=SearchResponse)
-async def create_search(search_data: SearchCreate, db: Session = Depends(get_db)):
-    """Store a new search with location and selected restaurants"""
+async def create_search(search_data: SearchCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Store a new search and its selected restaurants, their details are filled in by enrich_search"""
+    search_id = None
     try:
         logger.info("=== STARTING CREATE SEARCH ===")
-        # Create the search entry
-        db_search = Search(
-            location_name=search_data.location.name if search_data.location else None,
-            location_latitude=search_data.location.latitude if search_data.location else None,
-            location_longitude=search_data.location.longitude if search_data.location else None,
-            location_population=search_data.location.population if search_data.location else None,
-        )
-        
-        db.add(db_search)
-        db.commit()
-        db.refresh(db_search) 
-        logger.info(f"Created search with ID: {db_search.id}")
-        
-        # Prepare user restaurant data
-        user_restaurants_data = []
-        for restaurant_data in search_data.restaurants:
-            if restaurant_data:  # Skip null restaurants
-                user_restaurants_data.append({
-                    "name": restaurant_data.name,
-                    "address": restaurant_data.address,
-                    "categories": restaurant_data.categories,
-                    "categorySet": restaurant_data.categorySet,
-                    "position": restaurant_data.position.dict() if restaurant_data.position else None,
-                    "tomtom_poi_id": restaurant_data.tomtom_poi_id
-                })
-
-        # Get city restaurants 
-        city_restaurants_data = []
-        if search_data.location:
-            logger.info("=== STARTING CITY RESTAURANT SEARCH ===")
-            category_ids: Set[int] = set()
-            for restaurant_data in search_data.restaurants:
-                if restaurant_data and restaurant_data.categorySet:
-                    category_ids.update(restaurant_data.categorySet)
-            
-            if not category_ids:
-                category_ids = {7315}  
-            
-            logger.info(f"Searching city restaurants with categories: {category_ids}")
-            
-            population = search_data.location.population or 40000
-            
-            city_restaurants_data = await search_city_restaurants(
-                center_lat=search_data.location.latitude,
-                center_lon=search_data.location.longitude,
-                city_name=search_data.location.name,  
-                category_ids=category_ids,
-                population=population,
-            )
-            
-            logger.info(f"Found {len(city_restaurants_data)} city restaurants")
-            logger.info("=== COMPLETED CITY RESTAURANT SEARCH ===")
+        # Blocking session work goes through the threadpool so Groq calls keep the event loop
+        search_id = await run_in_threadpool(insert_search, search_data, db)
+        logger.info("Created search with ID: %s", search_id)
         
-        logger.info("=== STARTING CONCURRENT GROQ PROCESSING ===")
-        await process_all_restaurants(
-            user_restaurants_data, 
-            city_restaurants_data,
-            db_search.id, 
-            db
-        )
+        # Same shape as the TomTom city results, null restaurants skipped
+        user_restaurants_data = [
+            restaurant_data.model_dump() for restaurant_data in search_data.restaurants if restaurant_data
+        ]
+
+        logger.info("=== STARTING USER RESTAURANT PROCESSING ===")
+        user_rows, missing_user_details = await run_in_threadpool(build_skeleton_rows, user_restaurants_data, search_id, db)
+        await run_in_threadpool(store_restaurant_rows, RestaurantModel, user_rows, search_id, db)
+
+        # Groq details and the TomTom city search run after the response is sent, clients poll
+        # the search until its status is "ready" and recommendations wait on mark_pending's event
+        mark_pending(search_id)
+        background_tasks.add_task(enrich_search, search_id, search_data, missing_user_details)
 
-        result = await get_search(db_search.id, db)
-        logger.info(f"Search {db_search.id} completed successfully")
+        # get_search is sync so its queries run off the event loop
+        result = await run_in_threadpool(get_search, search_id, db)
+        logger.info("Search %s completed successfully", search_id)
         return result
     
     except Exception as e:
-        logger.error(f"Error creating search: {e}")
+        logger.error("Error creating search: %s", e)
+        if search_id is not None:
+            # Background tasks don't run when the handler fails, nothing else would ever finish the search
+            mark_done(search_id)
+            await run_in_threadpool(finish_failed_search, search_id, db)
         raise HTTPException(status_code=500, detail=f"Failed to create search: {str(e)}")
 
+def finish_failed_search(search_id: int, db: Session):
+    """Mark a search ready after create_search failed, so pollers and recommendations stop waiting on it"""
+    try:
+        db.rollback()
+        set_search_status(search_id, "ready", db)
+    except Exception as e:
+        logger.error("Failed to mark search %s ready: %s", search_id, e)
+
+def stream_searches_json():
+    """Yield every search as one JSON array, EXPORT_BATCH_SIZE searches in memory at a time"""
+    # Own session, the generator keeps running after the request's dependencies are torn down
+    db = SessionLocal()
+    try:
+        # select() rather than db.query(): the legacy Query uniques eager-loaded rows, which yield_per rejects
+        searches = db.scalars(
+            select(Search).options(
+                selectinload(Search.restaurants).joinedload(RestaurantModel.details),
+                selectinload(Search.city_restaurants).joinedload(CityRestaurantModel.details),
+            ).order_by(Search.id.desc()).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+
+        yield b"["
+        separator = b""
+        for search in searches:
+            yield separator + orjson.dumps(SearchResponse.model_validate(search).model_dump())
+            separator = b","
+        yield b"]"
+    finally:
+        db.close()
+
+# Declared before /searches/{search_id} so "export" isn't parsed as an id
+@router.get("/searches/export", response_model=List[SearchResponse])
+def export_searches():
+    """Stream all searches as a JSON array without building the full list in memory"""
+    return StreamingResponse(stream_searches_json(), media_type="application/json")
+
+# Read-only handlers are plain def so FastAPI runs their blocking queries in its threadpool
 @router.get("/searches/{search_id}", response_model=SearchResponse)
-async def get_search(search_id: int, db: Session = Depends(get_db)):
+def get_search(search_id: int, db: Session = Depends(get_db)):
     """Retrieve a search by ID with proper data type conversion"""
-    search = db.query(Search).filter(Search.id == search_id).first()
+    with search_cache_lock:
+        cached = search_cache.get(search_id)
+    if cached is not None:
+        return cached
+
+    # Load restaurants and their details alongside the search instead of querying per collection
+    search = db.query(Search).options(
+        selectinload(Search.restaurants).joinedload(RestaurantModel.details),
+        selectinload(Search.city_restaurants).joinedload(CityRestaurantModel.details),
+    ).filter(Search.id == search_id).one_or_none()
     if not search:
         raise HTTPException(status_code=404, detail="Search not found")
-    
-    # Get restaurants with details using joinedload for efficiency
-    restaurants = db.query(RestaurantModel).options(
-        joinedload(RestaurantModel.details)
-    ).filter(RestaurantModel.search_id == search_id).all()
-    
-    city_restaurants = db.query(CityRestaurantModel).options(
-        joinedload(CityRestaurantModel.details)
-    ).filter(CityRestaurantModel.search_id == search_id).all()
-
-    # Convert to response format with proper data types
-    location = None
-    if search.location_name:
-        location = {
-            "name": search.location_name,
-            "latitude": search.location_latitude,
-            "longitude": search.location_longitude,
-            "population": search.location_population
-        }
-    
-    # Convert restaurants to proper response format
-    restaurant_list = [convert_restaurant_to_response(restaurant) for restaurant in restaurants]
-    city_restaurant_list = [convert_city_restaurant_to_response(city_restaurant) for city_restaurant in city_restaurants]
-
-    return SearchResponse(
-        id=search.id,
-        location=location,
-        restaurants=restaurant_list,  # List[RestaurantResponse]
-        city_restaurants=city_restaurant_list,  # List[CityRestaurantResponse]
-        created_at=search.created_at
+
+    response = SearchResponse.model_validate(search)
+    # Details and city restaurants still arriving, a cached copy would stay incomplete.
+    # Checked on the loaded row, so it holds across workers and can't race enrich_search.
+    if search.status == "ready":
+        with search_cache_lock:
+            search_cache[search_id] = response
+    return response
+
+@router.get("/searches", response_model=SearchPage)
+def get_all_searches(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[int] = Query(None, ge=1, description="Return searches with an id below this one"),
+    db: Session = Depends(get_db)
+):
+    """Get a page of searches, newest first, with proper data type conversion"""
+    cache_key = (db.query(func.max(Search.id)).scalar(), cursor, limit)
+    with search_cache_lock:
+        cached = page_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # One IN query per collection for all searches rather than two queries per search
+    query = db.query(Search).options(
+        selectinload(Search.restaurants).joinedload(RestaurantModel.details),
+        selectinload(Search.city_restaurants).joinedload(CityRestaurantModel.details),
     )
+    # Keyset pagination on the primary key, each page is an index range scan instead of an OFFSET skip
+    if cursor is not None:
+        query = query.filter(Search.id < cursor)
+    searches = query.order_by(Search.id.desc()).limit(limit).all()
+    result = SEARCH_LIST_ADAPTER.validate_python(searches, from_attributes=True)
 
-@router.get("/searches", response_model=List[SearchResponse])
-async def get_all_searches(db: Session = Depends(get_db)):
-    """Get all searches with proper data type conversion"""
-    searches = db.query(Search).all()
-    result = []
-    
-    for search in searches:
-        restaurants = db.query(RestaurantModel).options(
-            joinedload(RestaurantModel.details)
-        ).filter(RestaurantModel.search_id == search.id).all()
-        
-        city_restaurants = db.query(CityRestaurantModel).options(
-            joinedload(CityRestaurantModel.details)
-        ).filter(CityRestaurantModel.search_id == search.id).all()
-        
-        location = None
-        if search.location_name:
-            location = {
-                "name": search.location_name,
-                "latitude": search.location_latitude,
-                "longitude": search.location_longitude,
-                "population": search.location_population,
-            }
-        
-        # Convert to proper response format
-        restaurant_list = [convert_restaurant_to_response(restaurant) for restaurant in restaurants]
-        city_restaurant_list = [convert_city_restaurant_to_response(city_restaurant) for city_restaurant in city_restaurants]
-        
-        result.append(SearchResponse(
-            id=search.id,
-            location=location,
-            restaurants=restaurant_list,
-            city_restaurants=city_restaurant_list,
-            created_at=search.created_at
-        ))
-    
-    return result
\ No newline at end of file
+    # A full page means there may be more searches after it
+    next_cursor = searches[-1].id if len(searches) == limit else None
+    page = SearchPage(items=result, next_cursor=next_cursor)
+    if all(search.status == "ready" for search in searches):
+        with search_cache_lock:
+            page_cache[cache_key] = page
+    return page
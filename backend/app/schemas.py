@@ -1,6 +1,16 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import AliasChoices, BaseModel, ConfigDict, Field, field_validator
+from typing import Any, List, Optional
 from datetime import datetime
+import orjson
+
+def parse_json_list(value: Any) -> list:
+    """Accept a list or a JSON array string from a Text column; None and malformed JSON become []"""
+    if isinstance(value, (str, bytes)):
+        try:
+            value = orjson.loads(value)
+        except orjson.JSONDecodeError:
+            return []
+    return value or []
 
 class Position(BaseModel):
     lat: float
@@ -15,6 +25,16 @@ class RestaurantDetailsBase(BaseModel):
     cuisine: Optional[str] = ""
     tags: List[str] = []  # Parse JSON to list in response
 
+    @field_validator("menu_highlights", "tags", mode="before")
+    @classmethod
+    def parse_lists(cls, value: Any) -> list:
+        return parse_json_list(value)
+
+    @field_validator("description", "review_summary", "cuisine", mode="before")
+    @classmethod
+    def empty_string_for_none(cls, value: Optional[str]) -> str:
+        return value or ""
+
 class RestaurantDetailsResponse(RestaurantDetailsBase):
     id: int
     groq_processed: bool = False
@@ -22,17 +42,23 @@ class RestaurantDetailsResponse(RestaurantDetailsBase):
     created_at: datetime
     updated_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
+# Shared by the user's restaurants and the city restaurants, the two tables have the same columns
 class RestaurantBase(BaseModel):
     name: str
     address: str
     categories: List[str] = []
-    categorySet: List[int] = []
+    # ORM rows store this as category_set
+    categorySet: List[int] = Field(default=[], validation_alias=AliasChoices("categorySet", "category_set"))
     position: Optional[Position] = None
     tomtom_poi_id: Optional[str] = None
 
+    @field_validator("categories", "categorySet", mode="before")
+    @classmethod
+    def parse_lists(cls, value: Any) -> list:
+        return parse_json_list(value)
+
 class RestaurantCreate(RestaurantBase):
     pass
 
@@ -41,48 +67,19 @@ class RestaurantResponse(RestaurantBase):
     search_id: int
     details: Optional[RestaurantDetailsResponse] = None
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
-class Restaurant(RestaurantBase):
-    id: int
-    search_id: int
+class CityRestaurantResponse(RestaurantBase):
     details: Optional[RestaurantDetailsResponse] = None
-    
-    class Config:
-        from_attributes = True
-
-class CityRestaurantBase(BaseModel):
-    name: str
-    address: str
-    categories: List[str] = []
-    categorySet: List[int] = []
-    position: Optional[Position] = None
-    tomtom_poi_id: Optional[str] = None
 
-class CityRestaurantCreate(CityRestaurantBase):
-    pass
+    model_config = ConfigDict(from_attributes=True)
 
-class CityRestaurant(CityRestaurantBase):
-    id: int
-    search_id: int
-    details: Optional[RestaurantDetailsResponse] = None
-    
-    class Config:
-        from_attributes = True
-
-class LocationBase(BaseModel):
+class Location(BaseModel):
     name: str
     latitude: float
     longitude: float
     population: Optional[int] = None
 
-class LocationCreate(LocationBase):
-    pass
-
-class Location(LocationBase):
-    pass
-
 class SearchBase(BaseModel):
     location: Optional[Location] = None
     restaurants: List[Optional[RestaurantCreate]] = []
@@ -90,21 +87,16 @@ class SearchBase(BaseModel):
 class SearchCreate(SearchBase):
     pass
 
-class CityRestaurantResponse(BaseModel):
-    name: str
-    address: str
-    categories: List[str] = []
-    categorySet: List[int] = []
-    position: Optional[Position] = None
-    tomtom_poi_id: Optional[str] = None
-    details: Optional[RestaurantDetailsResponse] = None
-
 class SearchResponse(BaseModel):
     id: int
     location: Optional[Location] = None
     restaurants: List[RestaurantResponse] = []
     city_restaurants: List[CityRestaurantResponse] = []
+    status: str = "ready"  # poll until "ready" for every restaurant's details
     created_at: datetime
     
-    class Config:
-        from_attributes = True
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+class SearchPage(BaseModel):
+    items: List[SearchResponse] = []
+    next_cursor: Optional[int] = None  # pass back as ?cursor= for the next page
@@ -1,24 +1,25 @@
 from fastapi.responses import JSONResponse
-import os
-import requests
+import httpx
+import orjson
 import time
 from typing import List, Dict, Set, Optional
-from dotenv import load_dotenv
 from threading import Lock
+import asyncio
 import logging
 
-logger = logging.getLogger(__name__)
+from services.http_client import http_client
+from config import get_settings
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-TOMTOM_API_KEY = os.getenv("TOMTOM_API_KEY")
+TOMTOM_API_KEY = get_settings().tomtom_api_key
 TOMTOM_BASE_URL = "https://api.tomtom.com/search/2/categorySearch"
 
 cache: Dict[str, List[Dict]] = {}
 bbox_cache: Dict[str, Dict] = {}  
 last_request_time = 0
 MIN_REQUEST_INTERVAL = 1
-request_lock = Lock()
+request_lock = asyncio.Lock()
 bbox_cache_lock = Lock()
 
 async def get_city_bounding_box(city_name: str, lat: float, lon: float) -> Optional[Dict]:
@@ -32,7 +33,7 @@ async def get_city_bounding_box(city_name: str, lat: float, lon: float) -> Optio
     # Check cache first
     with bbox_cache_lock:
         if cache_key in bbox_cache:
-            logger.info(f"Using cached bounding box for {city_name}")
+            logger.info("Using cached bounding box for %s", city_name)
             return bbox_cache[cache_key]
     
     try:
@@ -73,11 +74,11 @@ async def get_city_bounding_box(city_name: str, lat: float, lon: float) -> Optio
                 'bounded': 0  # Allow results outside viewbox but prefer inside
             }
             
-            logger.info(f"Searching Nominatim for: {query}")
-            response = requests.get(nominatim_url, params=params, headers=headers, timeout=5)
+            logger.info("Searching Nominatim for: %s", query)
+            response = await http_client.get(nominatim_url, params=params, headers=headers, timeout=5)
             
             if response.status_code == 200:
-                results = response.json()
+                results = orjson.loads(response.content)
                 
                 for result in results:
                     # Look for city-level results
@@ -95,7 +96,7 @@ async def get_city_bounding_box(city_name: str, lat: float, lon: float) -> Optio
                         max_distance = 0.5  # ~50km tolerance for city center differences
                         
                         if lat_diff > max_distance or lon_diff > max_distance:
-                            logger.info(f"Skipping {result.get('display_name')} - too far from expected location ({lat_diff:.3f}, {lon_diff:.3f})")
+                            logger.info("Skipping %s - too far from expected location (%.3f, %.3f)", result.get('display_name'), lat_diff, lon_diff)
                             continue
                         
                         bbox = result['boundingbox']  
@@ -112,7 +113,7 @@ async def get_city_bounding_box(city_name: str, lat: float, lon: float) -> Optio
                             bbox_lon_diff = abs(bbox_center_lon - lon)
                             
                             if bbox_lat_diff > max_distance or bbox_lon_diff > max_distance:
-                                logger.info(f"Skipping {result.get('display_name')} - bounding box center too far from expected location")
+                                logger.info("Skipping %s - bounding box center too far from expected location", result.get('display_name'))
                                 continue
                             
                             # Format for TomTom
@@ -127,26 +128,26 @@ async def get_city_bounding_box(city_name: str, lat: float, lon: float) -> Optio
                                 'matched_display_name': result.get('display_name', '')
                             }
                             
-                            logger.info(f"Found valid bounding box for {city_name}")
-                            logger.info(f"  Query: {query}")
-                            logger.info(f"  Matched: {result.get('display_name', '')}")
-                            logger.info(f"  Distance from expected: {lat_diff:.3f}°, {lon_diff:.3f}°")
-                            logger.info(f"  Geobias: {bbox_result['geobias']}")
+                            logger.info("Found valid bounding box for %s", city_name)
+                            logger.info("  Query: %s", query)
+                            logger.info("  Matched: %s", result.get('display_name', ''))
+                            logger.info("  Distance from expected: %.3f°, %.3f°", lat_diff, lon_diff)
+                            logger.info("  Geobias: %s", bbox_result['geobias'])
                             
                             # Cache only successful results
                             with bbox_cache_lock:
                                 bbox_cache[cache_key] = bbox_result
                             return bbox_result
             
-            time.sleep(1.1)
+            await asyncio.sleep(1.1)
         
-        logger.warning(f"No suitable bounding box found for {city_name} after trying all queries:")
+        logger.warning("No suitable bounding box found for %s after trying all queries:", city_name)
         for i, query in enumerate(search_queries):
-            logger.warning(f"  Query {i+1}: {query}")
+            logger.warning("  Query %s: %s", i+1, query)
         return None
         
     except Exception as e:
-        logger.error(f"Error getting bounding box for {city_name}: {e}")
+        logger.error("Error getting bounding box for %s: %s", city_name, e)
         return None
 
 def generate_fallback_bounding_box(lat: float, lon: float, population: int) -> Dict:
@@ -217,7 +218,7 @@ async def search_city_restaurants(
             "language": "en-US",
             "categorySet": category_set_str
         }
-        logger.info(f"Using Nominatim bounding box for {city_name}")
+        logger.info("Using Nominatim bounding box for %s", city_name)
         
     else:
         # Fallback to population-based bounding box
@@ -232,80 +233,80 @@ async def search_city_restaurants(
             "language": "en-US",
             "categorySet": category_set_str
         }
-        logger.info(f"Using fallback bounding box for {city_name}")
+        logger.info("Using fallback bounding box for %s", city_name)
     
     # Updated cache key to include bounding box info
     cache_key = f"{center_lat},{center_lon},{city_name},{category_set_str},{bbox_data.get('source')}"
 
     if cache_key in cache:
-        logger.info(f"Returning cached results for city restaurants")
+        logger.info("Returning cached results for city restaurants")
         return cache[cache_key]
     
     try:
-        with request_lock:
-            current_time = time.time()
-            elapsed = current_time - last_request_time
+        async with request_lock:
+            elapsed = time.time() - last_request_time
             
             if elapsed < MIN_REQUEST_INTERVAL:
-                time.sleep(MIN_REQUEST_INTERVAL - elapsed)
+                await asyncio.sleep(MIN_REQUEST_INTERVAL - elapsed)
 
-            url = f"{TOMTOM_BASE_URL}/.json"
-            
-            response = requests.get(url, params=search_params, timeout=15)
             last_request_time = time.time()
-            
-            if response.status_code == 429:
-                logger.warning("Rate limited for city restaurant search")
-                return []
 
-            if response.status_code != 200:
-                logger.error(f"TomTom API error for city search: {response.status_code}")
-                logger.error(f"Search params: {search_params}")
-                return []
+        url = f"{TOMTOM_BASE_URL}/.json"
+        
+        response = await http_client.get(url, params=search_params, timeout=15)
+        
+        if response.status_code == 429:
+            logger.warning("Rate limited for city restaurant search")
+            return []
+
+        if response.status_code != 200:
+            logger.error("TomTom API error for city search: %s", response.status_code)
+            logger.error("Search params: %s", search_params)
+            return []
+        
+        data = orjson.loads(response.content)
+        logger.info("TomTom returned %s results for %s", len(data.get('results', [])), city_name)
+        
+        for result in data.get("results", []):
+            poi = result.get("poi", {})
+            address = result.get("address", {})
+            position = result.get("position", {})
             
-            data = response.json()
-            logger.info(f"TomTom returned {len(data.get('results', []))} results for {city_name}")
+            # Create unique identifier to avoid duplicates
+            restaurant_key = f"{poi.get('name', '')}-{address.get('freeformAddress', '')}"
             
-            for result in data.get("results", []):
-                poi = result.get("poi", {})
-                address = result.get("address", {})
-                position = result.get("position", {})
-                
-                # Create unique identifier to avoid duplicates
-                restaurant_key = f"{poi.get('name', '')}-{address.get('freeformAddress', '')}"
-                
-                if restaurant_key in seen_restaurants:
-                    continue
-                
-                seen_restaurants.add(restaurant_key)
-                
-                restaurant_data = {
-                    "name": poi.get("name", "Unknown Restaurant"),
-                    "categories": poi.get("categories", []),
-                    "categorySet": [cat.get("id") for cat in poi.get("categorySet", [])],
-                    "address": address.get("freeformAddress", "Unknown location"),
-                    "tomtom_poi_id": result.get("id")
+            if restaurant_key in seen_restaurants:
+                continue
+            
+            seen_restaurants.add(restaurant_key)
+            
+            restaurant_data = {
+                "name": poi.get("name", "Unknown Restaurant"),
+                "categories": poi.get("categories", []),
+                "categorySet": [cat.get("id") for cat in poi.get("categorySet", [])],
+                "address": address.get("freeformAddress", "Unknown location"),
+                "tomtom_poi_id": result.get("id")
+            }
+            
+            if position:
+                restaurant_lat = position.get("lat")
+                restaurant_lon = position.get("lon")
+                restaurant_data["position"] = {
+                    "lat": restaurant_lat,
+                    "lon": restaurant_lon
                 }
-                
-                if position:
-                    restaurant_lat = position.get("lat")
-                    restaurant_lon = position.get("lon")
-                    restaurant_data["position"] = {
-                        "lat": restaurant_lat,
-                        "lon": restaurant_lon
-                    }
-                
-                all_restaurants.append(restaurant_data)
+            
+            all_restaurants.append(restaurant_data)
         
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         logger.error("Timeout error in city restaurant search")
         return []
     except Exception as e:
-        logger.error(f"Unexpected error in city restaurant search: {e}")
+        logger.error("Unexpected error in city restaurant search: %s", e)
         return []
     
     cache[cache_key] = all_restaurants
-    logger.info(f"Found {len(all_restaurants)} unique restaurants in {city_name} using {bbox_data.get('source', 'unknown')} method")
+    logger.info("Found %s unique restaurants in %s using %s method", len(all_restaurants), city_name, bbox_data.get('source', 'unknown'))
     return all_restaurants
 
 
@@ -1,13 +1,18 @@
-import os
-import json
+import orjson
 import asyncio
-import aiohttp
+import httpx
 from typing import Dict, Optional, List
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 import logging
-from threading import Lock
+import random
+import re
 import time
+from cachetools import TTLCache
+
+from config import get_settings
+from services.http_client import http_client
+from utils.request_coalescing import coalesce
 
 logger = logging.getLogger(__name__)
 
@@ -23,17 +28,36 @@ class GroqResponse:
     success: bool = False
 
 # Global state for rate limiting and caching 
-cache: Dict[str, GroqResponse] = {}
+# Successful results only, for a day; failures are retried on the next lookup
+cache: TTLCache = TTLCache(maxsize=10_000, ttl=24 * 3600)
+# Groq lookups currently in progress, keyed like the cache, so concurrent
+# searches asking for the same restaurant share a single API call
+_inflight: Dict[str, asyncio.Future] = {}
 last_request_time = 0
-MIN_REQUEST_INTERVAL = 0.6   
-request_lock = Lock()
+MIN_REQUEST_INTERVAL = 0.6
+request_lock = asyncio.Lock()
 
-# Rate limit tracking
-request_timestamps_primary = []
-request_timestamps_fallback = []
+# Rate limit tracking, callers queue on the lock until the per-minute window has room
+rate_limit_lock = asyncio.Lock()
+request_timestamps_primary: List[float] = []
+request_timestamps_fallback: List[float] = []
 daily_request_count_primary = 0
 daily_request_count_fallback = 0
 daily_reset_time = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+# Set from Groq's rate limit headers, no request is sent before this (time.monotonic())
+paused_until = 0.0
+
+# Below this many remaining requests/tokens, wait for Groq's window to reset
+LOW_REMAINING_THRESHOLD = {"requests": 2, "tokens": 1000}
+# 429s are retried with exponential backoff and jitter before giving up
+MAX_RATE_LIMIT_RETRIES = 3
+BACKOFF_BASE_SECONDS = 1.0
+# Groq reports resets as durations like "7.66s", "2m59.56s" or "120ms"
+RESET_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+RESET_UNIT_SECONDS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+# Restaurants per batched prompt, the schema preamble is sent once for all of them
+GROQ_BATCH_SIZE = 8
 
 PRIMARY_MODEL = "moonshotai/kimi-k2-instruct"
 
@@ -44,62 +68,94 @@ RATE_LIMITS = {
     }
 }
 
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_API_KEY = get_settings().groq_api_key
 GROQ_BASE_URL = "https://api.groq.com/openai/v1/chat/completions"
+# Completions can take a while, connecting shouldn't
+GROQ_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+# Whole request/response budget per call, httpx's read timeout only bounds each read.
+# It starts once the rate limit slot is claimed, so time spent queueing never counts.
+GROQ_REQUEST_TIMEOUT = 30.0
+# A batched reply carries GROQ_BATCH_SIZE restaurants' worth of tokens
+GROQ_BATCH_REQUEST_TIMEOUT = 60.0
 
 if not GROQ_API_KEY:
     logger.error("GROQ_API_KEY environment variable is required")
 
-def _check_rate_limits(model: str) -> bool:
-    """Check if we can make a request without hitting rate limits"""
+async def _acquire_request_slot(model: str) -> bool:
+    """Wait until a request fits the per-minute limit and claim it; False only once the daily limit is spent"""
     global daily_request_count_primary, daily_request_count_fallback, daily_reset_time
-    
-    now = datetime.now()
-    
-    # Reset daily counter if it's a new day
-    if now >= daily_reset_time + timedelta(days=1):
-        daily_request_count_primary = 0
-        daily_request_count_fallback = 0
-        daily_reset_time = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    # Get appropriate tracking variables
-    if model == PRIMARY_MODEL:
-        timestamps = request_timestamps_primary
-        daily_count = daily_request_count_primary
-    else:
-        timestamps = request_timestamps_fallback
-        daily_count = daily_request_count_fallback
-    
-    limits = RATE_LIMITS[model]
-    
-    # Check daily limit
-    if daily_count >= limits["requests_per_day"]:
-        logger.warning(f"Daily request limit reached for {model}")
-        return False
-    
-    with request_lock:
-        # Clean old timestamps (older than 1 minute)
-        cutoff = now - timedelta(minutes=1)
-        timestamps[:] = [ts for ts in timestamps if ts > cutoff]
-        
-        # Check per-minute limit
-        if len(timestamps) >= limits["requests_per_minute"]:
-            logger.warning(f"Per-minute rate limit reached for {model}")
+
+    async with rate_limit_lock:
+        now = datetime.now()
+
+        # Reset daily counter if it's a new day
+        if now >= daily_reset_time + timedelta(days=1):
+            daily_request_count_primary = 0
+            daily_request_count_fallback = 0
+            daily_reset_time = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        # Get appropriate tracking variables
+        if model == PRIMARY_MODEL:
+            timestamps = request_timestamps_primary
+            daily_count = daily_request_count_primary
+        else:
+            timestamps = request_timestamps_fallback
+            daily_count = daily_request_count_fallback
+
+        limits = RATE_LIMITS[model]
+
+        # Check daily limit
+        if daily_count >= limits["requests_per_day"]:
+            logger.warning("Daily request limit reached for %s", model)
             return False
-        
-        return True
 
-def _record_request(model: str):
-    """Record a successful request for rate limiting"""
-    global daily_request_count_primary, daily_request_count_fallback
-    
-    with request_lock:
+        while True:
+            current = time.monotonic()
+            # Clean old timestamps (older than 1 minute)
+            timestamps[:] = [ts for ts in timestamps if ts > current - 60]
+
+            delay = paused_until - current
+            if len(timestamps) >= limits["requests_per_minute"]:
+                # Room opens up when the oldest request in the window expires
+                delay = max(delay, timestamps[0] + 60 - current)
+            if delay <= 0:
+                break
+
+            logger.info("Groq rate limit reached for %s, waiting %.1fs", model, delay)
+            await asyncio.sleep(delay)
+
+        # Count every request sent, Groq counts failed ones too
+        timestamps.append(time.monotonic())
         if model == PRIMARY_MODEL:
-            request_timestamps_primary.append(datetime.now())
             daily_request_count_primary += 1
         else:
-            request_timestamps_fallback.append(datetime.now())
             daily_request_count_fallback += 1
+        return True
+
+def _parse_reset_duration(value: str) -> float:
+    """Seconds in a Groq reset header value, 0 if it can't be read"""
+    return sum(float(amount) * RESET_UNIT_SECONDS[unit] for amount, unit in RESET_DURATION_PART.findall(value or ""))
+
+def _update_rate_limits(headers: httpx.Headers):
+    """Hold off further requests when Groq reports the current window is nearly used up"""
+    global paused_until
+
+    for kind, threshold in LOW_REMAINING_THRESHOLD.items():
+        remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+        if remaining is None or not remaining.isdigit() or int(remaining) >= threshold:
+            continue
+
+        reset = _parse_reset_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+        if reset > 0:
+            logger.info("Groq reports %s %s remaining, pausing %.1fs", remaining, kind, reset)
+            paused_until = max(paused_until, time.monotonic() + reset)
+
+def _backoff_delay(attempt: int, retry_after: Optional[str]) -> float:
+    """Delay before retrying a 429, Groq's retry-after when given, else exponential with full jitter"""
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return random.uniform(0, BACKOFF_BASE_SECONDS * 2 ** attempt)
 
 def _create_prompt(restaurant_name: str, restaurant_address: str, categories: List[str] = None) -> str:
     """Create the prompt for Groq API with clear category information"""
@@ -130,9 +186,44 @@ def _create_prompt(restaurant_name: str, restaurant_address: str, categories: Li
             
     return prompt
 
-async def _make_request(prompt: str, model: str) -> Optional[Dict]:
-    """Make a request to Groq API"""
-    global last_request_time
+def _create_batch_prompt(restaurants: List[dict]) -> str:
+    """Create one prompt asking for the details of several restaurants, numbered from 1"""
+    restaurant_lines = []
+    for number, restaurant in enumerate(restaurants, start=1):
+        line = f"{number}. Name: {restaurant['name']} | Address: {restaurant['address']}"
+        category_names = [str(cat) for cat in restaurant.get("categories") or [] if cat]
+        if category_names:
+            line += f" | Restaurant Type/Categories: {', '.join(category_names)}"
+        restaurant_lines.append(line)
+    restaurant_info = "\n        ".join(restaurant_lines)
+
+    return f"""You are an API that extracts structured data about restaurants based on their name, address, and type. Return the information in strict JSON format using the exact schema below, with one entry per restaurant listed. If any data is not available or cannot be reasonably inferred, return empty values ("" for strings, [] for arrays, null for integers).
+
+        Schema:
+        {{
+        "restaurants": [
+            {{
+            "number": integer (the restaurant's number from the list below),
+            "description": string (brief description of the restaurant, 1-2 sentences),
+            "review_summary": string (general customer sentiment and highlights),
+            "menu_highlights": string[] (popular or signature dishes/items),
+            "price": integer (1 to 5 scale: 1=very cheap, 2=cheap, 3=moderate, 4=expensive, 5=very expensive),
+            "cuisine": string (type of cuisine or food category),
+            "tags": string[] (descriptive tags like "family-friendly", "romantic", "casual", "upscale", etc.)
+            }}
+        ]
+        }}
+
+        Restaurants:
+        {restaurant_info}
+
+        Return only the JSON object with no additional text or commentary."""
+
+async def _make_request(
+    prompt: str, model: str, max_tokens: int = 500, timeout: float = GROQ_REQUEST_TIMEOUT
+) -> Optional[Dict]:
+    """Make a request to Groq API, backing off and retrying when rate limited"""
+    global last_request_time, paused_until
     
     headers = {
         "Authorization": f"Bearer {GROQ_API_KEY}",
@@ -148,116 +239,196 @@ async def _make_request(prompt: str, model: str) -> Optional[Dict]:
             }
         ],
         "temperature": 0.1,
-        "max_tokens": 500,
+        "max_tokens": max_tokens,
         "response_format": {"type": "json_object"}
     }
     
-    try:
-        # Rate limiting similar to restaurant.py style
-        with request_lock:
-            current_time = time.time()
-            elapsed = current_time - last_request_time
-            
-            if elapsed < MIN_REQUEST_INTERVAL:
-                await asyncio.sleep(MIN_REQUEST_INTERVAL - elapsed)
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                GROQ_BASE_URL,
-                headers=headers,
-                json=payload,
-                timeout=aiohttp.ClientTimeout(total=30)
-            ) as response:
+    for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+        if not await _acquire_request_slot(model):
+            return None
+
+        try:
+            # Space out requests; the lock makes concurrent lookups wait their turn
+            async with request_lock:
+                elapsed = time.time() - last_request_time
+
+                if elapsed < MIN_REQUEST_INTERVAL:
+                    await asyncio.sleep(MIN_REQUEST_INTERVAL - elapsed)
+
                 last_request_time = time.time()
-                
-                if response.status == 200:
-                    data = await response.json()
-                    return data
-                elif response.status == 429:
-                    logger.warning(f"Rate limit hit for model {model}")
-                    return None
-                else:
-                    error_text = await response.text()
-                    logger.error(f"API error {response.status} for model {model}: {error_text}")
-                    return None
-                    
-    except asyncio.TimeoutError:
-        logger.error(f"Timeout for model {model}")
-        return None
-    except Exception as e:
-        logger.error(f"Unexpected error for model {model}: {e}")
-        return None
+
+            # Shared client, calls reuse pooled keep-alive connections instead of a TLS handshake each
+            response = await asyncio.wait_for(
+                http_client.post(
+                    GROQ_BASE_URL,
+                    headers=headers,
+                    content=orjson.dumps(payload),
+                    timeout=GROQ_TIMEOUT
+                ),
+                timeout=timeout
+            )
+            _update_rate_limits(response.headers)
+
+            if response.status_code == 200:
+                return orjson.loads(response.content)
+            elif response.status_code == 429:
+                delay = _backoff_delay(attempt, response.headers.get("retry-after"))
+                logger.warning("Rate limit hit for model %s, retrying in %.1fs", model, delay)
+                # Other lookups hold off too rather than collecting 429s of their own
+                paused_until = max(paused_until, time.monotonic() + delay)
+            else:
+                logger.error("API error %s for model %s: %s", response.status_code, model, response.text)
+                return None
+
+        except (httpx.TimeoutException, asyncio.TimeoutError):
+            logger.error("Timeout for model %s", model)
+            return None
+        except Exception as e:
+            logger.error("Unexpected error for model %s: %s", model, e)
+            return None
+
+    logger.warning("Still rate limited for model %s after %s retries", model, MAX_RATE_LIMIT_RETRIES)
+    return None
+
+def _details_from_dict(parsed_data: Dict, model_used: str) -> GroqResponse:
+    """Build a GroqResponse from one restaurant's object in the model's JSON output"""
+    return GroqResponse(
+        description=parsed_data.get("description", ""),
+        review_summary=parsed_data.get("review_summary", ""),
+        menu_highlights=parsed_data.get("menu_highlights", []),
+        price_level=parsed_data.get("price"), 
+        cuisine=parsed_data.get("cuisine", ""),
+        tags=parsed_data.get("tags", []),
+        model_used=model_used,
+        success=True
+    )
 
 def _parse_response(response_data: Dict, model_used: str) -> GroqResponse:
     """Parse Groq API response into GroqResponse object"""
     try:
         content = response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
-        parsed_data = json.loads(content)
-        
-        return GroqResponse(
-            description=parsed_data.get("description", ""),
-            review_summary=parsed_data.get("review_summary", ""),
-            menu_highlights=parsed_data.get("menu_highlights", []),
-            price_level=parsed_data.get("price"), 
-            cuisine=parsed_data.get("cuisine", ""),
-            tags=parsed_data.get("tags", []),
-            model_used=model_used,
-            success=True
-        )
-    except (json.JSONDecodeError, KeyError, IndexError) as e:
-        logger.error(f"Failed to parse response from {model_used}: {e}")
-        logger.error(f"Raw content that failed to parse: {content}")
+        return _details_from_dict(orjson.loads(content), model_used)
+    except (orjson.JSONDecodeError, KeyError, IndexError) as e:
+        logger.error("Failed to parse response from %s: %s", model_used, e)
+        logger.error("Raw content that failed to parse: %s", content)
         return GroqResponse(model_used=model_used, success=False)
 
+def _parse_batch_response(response_data: Dict, model_used: str, count: int) -> Dict[int, GroqResponse]:
+    """Parse a batched response into GroqResponses by list position; restaurants missing from it are left out"""
+    try:
+        content = response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
+        entries = orjson.loads(content).get("restaurants")
+    except (orjson.JSONDecodeError, AttributeError, IndexError) as e:
+        logger.error("Failed to parse batch response from %s: %s", model_used, e)
+        return {}
+
+    results = {}
+    for entry in entries if isinstance(entries, list) else []:
+        number = entry.get("number") if isinstance(entry, dict) else None
+        # Entries are matched on their number, a skipped or unnumbered one can't shift the rest
+        if isinstance(number, int) and 1 <= number <= count:
+            results[number - 1] = _details_from_dict(entry, model_used)
+
+    if len(results) != count:
+        logger.warning("Batch response from %s covered %s of %s restaurants", model_used, len(results), count)
+    return results
+
+def _cache_key(restaurant_name: str, restaurant_address: str, tomtom_poi_id: str) -> str:
+    return tomtom_poi_id or f"{restaurant_name}-{restaurant_address}"
+
 async def get_restaurant_details(restaurant_name: str, restaurant_address: str, tomtom_poi_id: str, categories: List[str] = None) -> GroqResponse:
-    """Get enhanced restaurant details from Groq API with Moonshot retry logic"""
+    """Get enhanced restaurant details from Groq API, cached and shared with identical in-flight lookups"""
     
     # Use tomtom_poi_id as cache key
-    cache_key = tomtom_poi_id or f"{restaurant_name}-{restaurant_address}"
+    cache_key = _cache_key(restaurant_name, restaurant_address, tomtom_poi_id)
     
     # Check cache first
-    if cache_key in cache:
-        logger.info(f"Returning cached Groq results for {restaurant_name}")
-        return cache[cache_key]
+    result = cache.get(cache_key)
+    if result is not None:
+        logger.info("Returning cached Groq results for %s", restaurant_name)
+        return result
+
+    async def fetch() -> GroqResponse:
+        result = await _fetch_restaurant_details(restaurant_name, restaurant_address, categories)
+        if result.success:
+            cache[cache_key] = result
+        return result
+
+    return await coalesce(_inflight, cache_key, fetch)
+
+async def get_restaurant_details_batch(restaurants: List[dict]) -> List[Optional[GroqResponse]]:
+    """Get details for up to GROQ_BATCH_SIZE restaurants in one Groq call, in the order given.
+
+    Cached restaurants are answered from the cache. Restaurants the batched reply leaves out,
+    or that another lookup is already fetching, come back as None for the caller to look up
+    one by one with get_restaurant_details once it has stored the answers it already has.
+    """
+    results: Dict[int, GroqResponse] = {}
+    uncached: Dict[int, str] = {}
+    for index, restaurant in enumerate(restaurants):
+        cache_key = _cache_key(restaurant["name"], restaurant["address"], restaurant.get("tomtom_poi_id"))
+        result = cache.get(cache_key)
+        if result is not None:
+            results[index] = result
+        elif cache_key not in _inflight and cache_key not in uncached.values():
+            uncached[index] = cache_key
+
+    # A lone restaurant gains nothing from the batch prompt
+    if len(uncached) > 1:
+        # Registered as in flight so concurrent lookups wait on the batch instead of asking again
+        loop = asyncio.get_running_loop()
+        for cache_key in uncached.values():
+            _inflight[cache_key] = loop.create_future()
+
+        batch = list(uncached)
+        try:
+            fetched = await _fetch_batch_details([restaurants[index] for index in batch])
+            for position, result in fetched.items():
+                index = batch[position]
+                cache[uncached[index]] = result
+                _inflight[uncached[index]].set_result(result)
+                results[index] = result
+        finally:
+            for cache_key in uncached.values():
+                fut = _inflight.pop(cache_key)
+                # Left out of the reply, waiters make their own request
+                if not fut.done():
+                    fut.cancel()
+
+    return [results.get(index) for index in range(len(restaurants))]
+
+async def _fetch_batch_details(restaurants: List[dict]) -> Dict[int, GroqResponse]:
+    """One batched Groq call, results keyed by position in restaurants; empty if the call failed"""
+    response_data = await _make_request(
+        _create_batch_prompt(restaurants),
+        PRIMARY_MODEL,
+        max_tokens=500 * len(restaurants),
+        timeout=GROQ_BATCH_REQUEST_TIMEOUT,
+    )
+    if not response_data:
+        logger.warning("Batch Groq request failed for %s restaurants", len(restaurants))
+        return {}
+    return _parse_batch_response(response_data, PRIMARY_MODEL, len(restaurants))
+
+async def _fetch_restaurant_details(restaurant_name: str, restaurant_address: str, categories: List[str] = None) -> GroqResponse:
+    """Get enhanced restaurant details from Groq API with Moonshot retry logic"""
     
     prompt = _create_prompt(restaurant_name, restaurant_address, categories)
     
-    # Check rate limits for primary model (Moonshot)
-    if not _check_rate_limits(PRIMARY_MODEL):
-        logger.warning(f"Moonshot rate limit exceeded for {restaurant_name}, skipping Groq processing")
-        result = GroqResponse(success=False)
-        cache[cache_key] = result
-        return result
-    
-    # Try Moonshot model (first attempt)
+    # Try Moonshot model (first attempt), waits for rate limit room and retries 429s itself
     response_data = await _make_request(prompt, PRIMARY_MODEL)
     if response_data:
-        _record_request(PRIMARY_MODEL)
-        result = _parse_response(response_data, PRIMARY_MODEL)
-        cache[cache_key] = result
-        return result
+        return _parse_response(response_data, PRIMARY_MODEL)
     
     # If first attempt failed, wait briefly and retry Moonshot once
-    logger.info(f"Moonshot failed for {restaurant_name}, retrying after brief delay")
+    logger.info("Moonshot failed for %s, retrying after brief delay", restaurant_name)
     await asyncio.sleep(2)  # Brief delay for API recovery
     
-    # Check rate limits again before retry
-    if not _check_rate_limits(PRIMARY_MODEL):
-        logger.warning(f"Moonshot rate limit hit during retry for {restaurant_name}")
-        result = GroqResponse(success=False)
-        cache[cache_key] = result
-        return result
-    
     # Retry Moonshot
     response_data = await _make_request(prompt, PRIMARY_MODEL)
     if response_data:
-        _record_request(PRIMARY_MODEL)
-        result = _parse_response(response_data, PRIMARY_MODEL)
-        cache[cache_key] = result
-        return result
+        return _parse_response(response_data, PRIMARY_MODEL)
     
     # Both attempts failed - return empty details rather than poor quality fallback
-    logger.warning(f"Moonshot failed twice for {restaurant_name}, creating empty details")
-    result = GroqResponse(success=False)
-    cache[cache_key] = result
-    return result
\ No newline at end of file
+    logger.warning("Moonshot failed twice for %s, no details", restaurant_name)
+    return GroqResponse(success=False)
\ No newline at end of file
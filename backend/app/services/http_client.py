@@ -0,0 +1,12 @@
+import httpx
+
+# Shared client so upstream API calls reuse pooled connections instead of
+# opening a new one per request. Closed on app shutdown.
+# Sized so every concurrent Groq lookup keeps a warm connection alongside the typeahead calls.
+http_client = httpx.AsyncClient(
+    timeout=10.0,
+    limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+)
+
+async def close_http_client():
+    await http_client.aclose()
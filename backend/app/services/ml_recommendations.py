@@ -5,7 +5,6 @@ from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.preprocessing import StandardScaler
 import logging
-import json
 import re
 from dataclasses import dataclass
 from sqlalchemy.orm import Session
@@ -92,21 +91,9 @@ class RestaurantRecommendationSystem:
                 # Get details or use empty defaults
                 details = restaurant.details if restaurant.details else None
                 
-                # Parse JSON fields safely
-                menu_highlights = []
-                tags = []
-                
-                if details and details.menu_highlights:
-                    try:
-                        menu_highlights = json.loads(details.menu_highlights)
-                    except (json.JSONDecodeError, TypeError):
-                        menu_highlights = []
-                
-                if details and details.tags:
-                    try:
-                        tags = json.loads(details.tags)
-                    except (json.JSONDecodeError, TypeError):
-                        tags = []
+                # JSON columns, already decoded to lists
+                menu_highlights = (details.menu_highlights or []) if details else []
+                tags = (details.tags or []) if details else []
                 
                 features = RestaurantFeatures(
                     restaurant_id=restaurant.id,
@@ -122,7 +109,7 @@ class RestaurantRecommendationSystem:
                 features_list.append(features)
                 
             except Exception as e:
-                logger.error(f"Error extracting features from {restaurant.name}: {e}")
+                logger.error("Error extracting features from %s: %s", restaurant.name, e)
                 # Add minimal features to avoid breaking the system
                 features_list.append(RestaurantFeatures(
                     restaurant_id=restaurant.id,
@@ -135,7 +122,7 @@ class RestaurantRecommendationSystem:
                     tags=[]
                 ))
         
-        logger.info(f"Extracted features from {len(features_list)} {restaurant_type} restaurants")
+        logger.info("Extracted features from %s %s restaurants", len(features_list), restaurant_type)
         return features_list
 
     def process_cuisine_features(self, features_list: List[RestaurantFeatures]) -> None:
@@ -163,7 +150,7 @@ class RestaurantRecommendationSystem:
                 features.cuisine_vector = cuisine_embeddings[i]
                 
         except Exception as e:
-            logger.error(f"Error generating cuisine embeddings: {e}")
+            logger.error("Error generating cuisine embeddings: %s", e)
             # Fallback to zeros
             for features in features_list:
                 features.cuisine_vector = np.zeros(SENTENCE_EMBEDDING_DIM)
@@ -219,7 +206,7 @@ class RestaurantRecommendationSystem:
                 features.review_embeddings = review_embeddings[i]
                 
         except Exception as e:
-            logger.error(f"Error generating text embeddings: {e}")
+            logger.error("Error generating text embeddings: %s", e)
             # Fallback to zeros
             for features in features_list:
                 features.description_embeddings = np.zeros(SENTENCE_EMBEDDING_DIM)
@@ -271,10 +258,10 @@ class RestaurantRecommendationSystem:
                 else:
                     features.tags_embeddings = np.zeros(SENTENCE_EMBEDDING_DIM)
                 
-                logger.debug(f"{features.name}: menu_items={len(features.menu_highlights)}, tags={len(features.tags)}, menu_dim={len(features.menu_embeddings)}, tags_dim={len(features.tags_embeddings)}")
+                logger.debug("%s: menu_items=%s, tags=%s, menu_dim=%s, tags_dim=%s", features.name, len(features.menu_highlights), len(features.tags), len(features.menu_embeddings), len(features.tags_embeddings))
                 
         except Exception as e:
-            logger.error(f"Error processing menu/tags: {e}")
+            logger.error("Error processing menu/tags: %s", e)
             # Fallback to zero vectors
             for features in features_list:
                 features.menu_embeddings = np.zeros(SENTENCE_EMBEDDING_DIM)
@@ -287,7 +274,7 @@ class RestaurantRecommendationSystem:
     ) -> np.ndarray:
         """Calculate similarity matrix with proper scaling for different feature types"""
         
-        logger.info(f"Calculating similarities: {len(user_features)} user vs {len(city_features)} city restaurants")
+        logger.info("Calculating similarities: %s user vs %s city restaurants", len(user_features), len(city_features))
         
         similarity_matrix = np.zeros((len(city_features), len(user_features)))
         feature_details = {}
@@ -397,7 +384,7 @@ class RestaurantRecommendationSystem:
     ) -> List[RecommendationResult]:
         """Generate top-k restaurant recommendations"""
         
-        logger.info(f"Generating recommendations: {len(user_restaurants)} user restaurants, {len(city_restaurants)} city restaurants")
+        logger.info("Generating recommendations: %s user restaurants, %s city restaurants", len(user_restaurants), len(city_restaurants))
         
         # Extract features
         user_features = self.extract_features_from_restaurants(user_restaurants, "user")
@@ -452,7 +439,7 @@ class RestaurantRecommendationSystem:
                 filtered_city_scores.append(score_data)
                 seen_names.add(city_name)
         
-        logger.info(f"Filtered out {len(city_restaurant_scores) - len(filtered_city_scores)} duplicate restaurants")
+        logger.info("Filtered out %s duplicate restaurants", len(city_restaurant_scores) - len(filtered_city_scores))
         
         # Sort by similarity and take top k from filtered results
         filtered_city_scores.sort(key=lambda x: x['similarity'], reverse=True)
@@ -471,7 +458,7 @@ class RestaurantRecommendationSystem:
                 feature_scores=rec['feature_scores']
             ))
         
-        logger.info(f"Generated {len(recommendations)} recommendations")
+        logger.info("Generated %s recommendations", len(recommendations))
         return recommendations
 
 # Global instance
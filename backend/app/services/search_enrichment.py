@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict
+
+from fastapi.concurrency import run_in_threadpool
+
+from database import SessionLocal
+from models import Search
+
+logger = logging.getLogger(__name__)
+
+# Searches whose restaurant details and city restaurants are still being added in the background.
+# In-process only, like the other caches: a search is tracked by the worker that created it.
+_pending: Dict[int, asyncio.Event] = {}
+
+# How often a search enriched by another worker (or before a restart) is re-checked in the database
+STATUS_POLL_INTERVAL = 1.0
+
+def mark_pending(search_id: int):
+    """Register a search before its background enrichment is scheduled"""
+    _pending[search_id] = asyncio.Event()
+
+def mark_done(search_id: int):
+    """Release anyone waiting on the search, whether processing succeeded or not"""
+    event = _pending.pop(search_id, None)
+    if event:
+        event.set()
+
+def finish_interrupted_searches():
+    """Mark searches left pending/enriching by a previous process as ready, at startup.
+
+    Enrichment runs as a background task in the process that created the search, so a restart
+    (uvicorn --reload included) drops it and nothing would ever finish those searches.
+    """
+    db = SessionLocal()
+    try:
+        count = db.query(Search).filter(Search.status.in_(("pending", "enriching"))).update(
+            {Search.status: "ready"}, synchronize_session=False
+        )
+        db.commit()
+        if count:
+            logger.warning("Marked %s searches interrupted during enrichment as ready", count)
+    finally:
+        db.close()
+
+def load_search_status(search_id: int):
+    """Persisted status and created_at of a search, None if it doesn't exist"""
+    db = SessionLocal()
+    try:
+        return db.query(Search.status, Search.created_at).filter(Search.id == search_id).one_or_none()
+    finally:
+        db.close()
+
+async def poll_until_ready(search_id: int, timeout: float) -> bool:
+    """Wait for the search's status column to reach ready; False once the search is too old to still be enriching"""
+    while True:
+        row = await run_in_threadpool(load_search_status, search_id)
+        if row is None or row.status == "ready":
+            return True
+        # A search still unfinished this long after creation was abandoned, not slow
+        if datetime.utcnow() - row.created_at > timedelta(seconds=timeout):
+            logger.warning("Search %s was left %s, not waiting for it", search_id, row.status)
+            return False
+        await asyncio.sleep(STATUS_POLL_INTERVAL)
+
+async def wait_until_enriched(search_id: int, timeout: float) -> bool:
+    """Wait for a pending search's enrichment; False if still running after timeout"""
+    event = _pending.get(search_id)
+    # Only the worker enriching a search has its event; after a restart or on another
+    # worker, the status column is what says whether enrichment has finished
+    waiting = event.wait() if event is not None else poll_until_ready(search_id, timeout)
+
+    try:
+        return await asyncio.wait_for(waiting, timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning("Search %s still enriching after %ss", search_id, timeout)
+        return False
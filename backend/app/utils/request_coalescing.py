@@ -0,0 +1,42 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+async def coalesce(inflight: Dict[str, asyncio.Future], key: str, fetch: Callable[[], Awaitable[T]]) -> T:
+    """
+    Run fetch() for key, or wait on the identical call already in progress.
+
+    The first caller owns the call and publishes its result, or its exception, to
+    everyone waiting. If the owner is cancelled (client disconnect, timeout) the
+    future is cancelled too and waiters go on to make the call themselves.
+    """
+    while True:
+        fut = inflight.get(key)
+        if fut is None:
+            break
+        try:
+            # Shielded so one waiter being cancelled doesn't cancel the shared call
+            return await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            # Only swallow the owner giving up, a cancelled waiter still stops here
+            if not fut.cancelled():
+                raise
+
+    fut = asyncio.get_running_loop().create_future()
+    inflight[key] = fut
+    try:
+        result = await fetch()
+    except Exception as e:
+        fut.set_exception(e)
+        # Waiters re-raise it themselves; marks it retrieved when nobody was waiting
+        fut.exception()
+        raise
+    else:
+        fut.set_result(result)
+        return result
+    finally:
+        inflight.pop(key, None)
+        if not fut.done():
+            fut.cancel()
@@ -0,0 +1,28 @@
+import hashlib
+from typing import Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+# Typeahead results change rarely, so browsers and proxies may reuse them for an hour
+CACHE_CONTROL = "public, max-age=3600"
+
+
+def make_cache_entry(payload: bytes) -> Tuple[bytes, str]:
+    """Pair a serialized JSON payload with its content-hash ETag."""
+    etag = f'"{hashlib.blake2b(payload, digest_size=16).hexdigest()}"'
+    return payload, etag
+
+
+def cached_json_response(request: Request, payload: bytes, etag: str) -> Response:
+    """
+    Return the payload with caching headers, or an empty 304 when the
+    client's If-None-Match already names this ETag.
+    """
+    headers = {"Cache-Control": CACHE_CONTROL, "ETag": etag}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=payload, media_type="application/json", headers=headers)